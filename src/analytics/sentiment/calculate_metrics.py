@@ -1,7 +1,7 @@
 #!/bin/python
 
 import csv
-import json
+import orjson
 import os
 import pandas as pd
 import numpy as np
@@ -9,8 +9,7 @@ import subprocess
 import sys
 import time
 
-
-from datetime import datetime
+from collections import defaultdict
 from loguru import logger
 from tqdm import tqdm
 
@@ -18,40 +17,39 @@ from tqdm import tqdm
 def merge(source_dir, dest_dir, dest_file):
     """
     Merge processed individual json files
+    Segments are merged as parallel "label", "score" and "text" lists per keyword.
+    Files in the older format, with a list of {"label", "score", "text"} dicts per keyword, are converted while merging.
     """
     files = os.listdir(source_dir)
     json_files = [file for file in files if file.endswith(".json")]
 
-    result = {}
+    # state -> call_sign -> keyword -> "label"/"score"/"text" -> list of values
+    result = defaultdict(
+        lambda: defaultdict(lambda: defaultdict(lambda: defaultdict(list)))
+    )
 
     for i in tqdm(range(0, len(json_files)), desc="Processing files"):
         file_name = json_files[i]
         local_path = os.path.join(source_dir, file_name)
-        f = open(local_path)
-        sentiment_analysis = json.load(f)
-        for state in sentiment_analysis.keys():
-            if state not in result.keys():
-                result[state] = {}
-            for call_sign in sentiment_analysis[state].keys():
-                if call_sign not in result[state].keys():
-                    result[state][call_sign] = {}
-                for date in sentiment_analysis[state][call_sign].keys():
-                    for key, value in sentiment_analysis[state][call_sign][
-                        date
-                    ].items():
-                        if key not in result[state][call_sign].keys():
-                            result[state][call_sign][key] = sentiment_analysis[state][
-                                call_sign
-                            ][date][key]
+        with open(local_path, "rb") as f:
+            sentiment_analysis = orjson.loads(f.read())
+        for state, call_signs in sentiment_analysis.items():
+            for call_sign, dates in call_signs.items():
+                call_sign_result = result[state][call_sign]
+                for keywords in dates.values():
+                    for key, segs in keywords.items():
+                        key_result = call_sign_result[key]
+                        if isinstance(segs, list):
+                            for field in ("label", "score", "text"):
+                                key_result[field].extend(seg[field] for seg in segs)
                         else:
-                            result[state][call_sign][key].extend(
-                                sentiment_analysis[state][call_sign][date][key]
-                            )
+                            for field, values in segs.items():
+                                key_result[field].extend(values)
 
     output_path = os.path.join(dest_dir, f"{dest_file}.json")
     try:
-        with open(output_path, "w") as f:
-            json.dump(result, f, indent=4)
+        with open(output_path, "wb") as f:
+            f.write(orjson.dumps(result, option=orjson.OPT_INDENT_2))
     except IOError:
         logger.error(f"Error writing results to file {output_path}")
         return None
@@ -61,21 +59,16 @@ def merge(source_dir, dest_dir, dest_file):
 def list_new_folders(dest_dir, start_date_str):
     """
     Return a list of all folders in the given directory after "start_date", excluding those that start with a '.'
+    Folder names start with a zero padded "YYYY_MM_DD" date, so they are compared with "start_date_str" as strings.
     """
-    start_date = datetime.strptime(start_date_str, "%Y_%m_%d")
-
-    folders = [
-        name
-        for name in os.listdir(dest_dir)
-        if os.path.isdir(os.path.join(dest_dir, name)) and not name.startswith(".")
-    ]
-    filtered_folders = []
-    for folder in folders:
-        parts = folder.split("_")
-        folder_date = datetime.strptime(f"{parts[0]}_{parts[1]}_{parts[2]}", "%Y_%m_%d")
-        if folder_date >= start_date:
-            filtered_folders.append(folder)
-    return filtered_folders
+    with os.scandir(dest_dir) as entries:
+        return [
+            entry.name
+            for entry in entries
+            if entry.is_dir()
+            and not entry.name.startswith(".")
+            and entry.name[:10] >= start_date_str
+        ]
 
 
 def merge_json_files(sentiment_buffer, merged_json, start_date_str="2024_06_26"):
@@ -96,9 +89,8 @@ def merge_json_files(sentiment_buffer, merged_json, start_date_str="2024_06_26")
 def calc_metrics(text, dest_dir, dest_file, keyword_list):
     """
     Calculate metrics and store in a csv
+    Accepts merged files in both the parallel-list and the older list-of-dicts format.
     """
-    result = []
-
     filename = os.path.join(dest_dir, f"{dest_file}.csv")
 
     fields = ["State", "Call_Sign"]
@@ -108,57 +100,44 @@ def calc_metrics(text, dest_dir, dest_file, keyword_list):
         fields.append(f"{keyword}_Neutral_Count")
         fields.append(f"{keyword}_Negative_Count")
 
-    for state in tqdm(text.keys()):
-        for call_sign in text[state].keys():
-            csv_line = {"State": state, "Call_Sign": call_sign}
-
-            metrics_dict = {}
-
-            for keyword in keyword_list:
-                metrics_dict[keyword] = [0, 0]
-                metrics_dict[keyword] = {"positive": 0, "neutral": 0, "negative": 0}
-                for seg in text[state][call_sign][keyword]:
-                    if seg["label"] == "positive":
-                        metrics_dict[keyword]["positive"] += 1
-                    elif seg["label"] == "negative":
-                        metrics_dict[keyword]["negative"] += 1
-                    else:
-                        metrics_dict[keyword]["neutral"] += 1
-                csv_line[f"{keyword}_Positive_Count"] = metrics_dict[keyword][
-                    "positive"
-                ]
-                csv_line[f"{keyword}_Neutral_Count"] = metrics_dict[keyword]["neutral"]
-                csv_line[f"{keyword}_Negative_Count"] = metrics_dict[keyword][
-                    "negative"
-                ]
-
-            result.append(csv_line)
-
     with open(filename, "w") as csvfile:
-        # creating a csv dict writer object
-        writer = csv.DictWriter(csvfile, fieldnames=fields)
+        # creating a csv writer object
+        writer = csv.writer(csvfile)
 
         # writing headers (field names)
-        writer.writeheader()
-
-        # writing data rows
-        writer.writerows(result)
+        writer.writerow(fields)
+
+        # writing data rows, one per call sign as soon as its counts are ready
+        for state in tqdm(text.keys()):
+            for call_sign, keywords in text[state].items():
+                # Row values in the same order as fields
+                csv_line = [state, call_sign]
+
+                for keyword in keyword_list:
+                    segs = keywords[keyword]
+                    # Merged files written before the parallel-list format hold a
+                    # list of {"label", "score", "text"} dicts per keyword
+                    if isinstance(segs, list):
+                        labels = [seg["label"] for seg in segs]
+                    else:
+                        labels = segs["label"]
+                    positive = labels.count("positive")
+                    negative = labels.count("negative")
+                    csv_line.extend(
+                        (positive, len(labels) - positive - negative, negative)
+                    )
+
+                writer.writerow(csv_line)
     return
 
 
 def list_new_json_files(source_dir, start_date_str):
-    start_date = datetime.strptime(start_date_str, "%Y_%m_%d")
-
-    files = os.listdir(source_dir)
-    json_files = [file for file in files if file.endswith(".json")]
-    filtered_files = []
-    for file in json_files:
-        file_date_str = file.split(".")[0]
-        parts = file_date_str.split("_")
-        file_date = datetime.strptime(f"{parts[0]}_{parts[1]}_{parts[2]}", "%Y_%m_%d")
-        if file_date >= start_date:
-            filtered_files.append(file)
-    return filtered_files
+    with os.scandir(source_dir) as entries:
+        return [
+            entry.name
+            for entry in entries
+            if entry.name.endswith(".json") and entry.name[:10] >= start_date_str
+        ]
 
 
 def calculate_stats(merged_json_dir, dest_dir, start_date_str="2024_06_26"):
@@ -173,8 +152,8 @@ def calculate_stats(merged_json_dir, dest_dir, start_date_str="2024_06_26"):
     # Calculate metrics for each json file
     for json_file in json_files:
         local_path = os.path.join(merged_json_dir, json_file)
-        f = open(local_path)
-        text = json.load(f)
+        with open(local_path, "rb") as f:
+            text = orjson.loads(f.read())
 
         dest_file = json_file.split(".")[0]
         logger.info(f"calculating metrics for: {dest_file}.csv")
@@ -207,21 +186,16 @@ def combined_sentiment(source_dir, file_name, column_order, keyword_list):
             + df[f"{keyword}_Neutral_Count"]
             + df[f"{keyword}_Negative_Count"]
         )
-        # Calculate the combined sentiment
-        df[f"{keyword}_Combined_Sentiment"] = df.apply(
-            lambda row: np.nan
-            if row[f"{keyword}_Count"] == 0
-            else round(
-                (
-                    row[f"{keyword}_Positive_Count"]
-                    - row[f"{keyword}_Negative_Count"]
-                    + row[f"{keyword}_Count"]
-                )
-                / (2 * row[f"{keyword}_Count"]),
-                2,
-            ),
-            axis=1,
-        )
+        # Calculate the combined sentiment, NaN for call signs with no mentions
+        count = df[f"{keyword}_Count"].to_numpy()
+        positive = df[f"{keyword}_Positive_Count"].to_numpy()
+        negative = df[f"{keyword}_Negative_Count"].to_numpy()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            df[f"{keyword}_Combined_Sentiment"] = np.where(
+                count == 0,
+                np.nan,
+                np.round((positive - negative + count) / (2 * count), 2),
+            )
 
     df = df[column_order]
     # saving the dataframe
@@ -230,18 +204,12 @@ def combined_sentiment(source_dir, file_name, column_order, keyword_list):
 
 
 def list_new_csv_files(source_dir, start_date_str):
-    start_date = datetime.strptime(start_date_str, "%Y_%m_%d")
-
-    files = os.listdir(source_dir)
-    csv_files = [file for file in files if file.endswith(".csv")]
-    filtered_files = []
-    for file in csv_files:
-        file_date_str = file.split(".")[0]
-        parts = file_date_str.split("_")
-        file_date = datetime.strptime(f"{parts[0]}_{parts[1]}_{parts[2]}", "%Y_%m_%d")
-        if file_date >= start_date:
-            filtered_files.append(file)
-    return filtered_files
+    with os.scandir(source_dir) as entries:
+        return [
+            entry.name
+            for entry in entries
+            if entry.name.endswith(".csv") and entry.name[:10] >= start_date_str
+        ]
 
 
 def combine_sentiment_by_callsign(metrics, keyword_list, start_date_str="2024_06_26"):
@@ -284,21 +252,18 @@ def fill_nulls_and_return_mean_columns(source_dir, file_name, keyword_list):
     date = file_name.split(".")[0]
     df["Date"] = date
 
-    for keyword in keyword_list:
-        # Fill null values in 'Biden_Combined_Sentiment' with the mean value grouped by 'State'
-        df[f"{keyword}_Combined_Sentiment"] = df.groupby("State")[
-            f"{keyword}_Combined_Sentiment"
-        ].transform(lambda x: x.fillna(round(x.mean(), 2)))
-
-        mean_col_name = f"{keyword}_Combined_Sentiment_Mean"
-        # Append the mean column name to the list of mean columns
-        mean_columns.append(mean_col_name)
-        # Compute the mean value grouped by 'State' and store it in a new column
-        df[mean_col_name] = (
-            df.groupby("State")[f"{keyword}_Combined_Sentiment"]
-            .transform("mean")
-            .round(4)
-        )
+    sentiment_columns = [f"{keyword}_Combined_Sentiment" for keyword in keyword_list]
+    sentiment_mean_columns = [f"{column}_Mean" for column in sentiment_columns]
+    mean_columns.extend(sentiment_mean_columns)
+
+    # Fill null values in all '<keyword>_Combined_Sentiment' columns with the mean value grouped by 'State'
+    state_means = df.groupby("State")[sentiment_columns].transform("mean")
+    df[sentiment_columns] = df[sentiment_columns].fillna(state_means.round(2))
+
+    # Compute the mean value grouped by 'State' and store it in new mean columns
+    df[sentiment_mean_columns] = (
+        df.groupby("State")[sentiment_columns].transform("mean").round(4).to_numpy()
+    )
 
     # Return the DataFrame with only 'State' and mean columns
     df = df[mean_columns].drop_duplicates().reset_index(drop=True)
@@ -313,13 +278,12 @@ def combine_all_files_in_directory(
     To combine DataFrames for all files in a directory
     """
     all_files = list_new_csv_files(source_dir, start_date_str)
-    combined_df = pd.DataFrame()
 
-    for file_name in all_files:
-        df_filled = fill_nulls_and_return_mean_columns(
-            source_dir, file_name, keyword_list
-        )
-        combined_df = pd.concat([combined_df, df_filled], ignore_index=True)
+    frames = [
+        fill_nulls_and_return_mean_columns(source_dir, file_name, keyword_list)
+        for file_name in all_files
+    ]
+    combined_df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
 
     os.makedirs(dest_dir, exist_ok=True)
     local_path = os.path.join(dest_dir, "combined_mean_sentiment_data.csv")
@@ -1,20 +1,62 @@
 #!/bin/python
 
 import argparse
-import json
 import multiprocessing
 import math
+import orjson
 import os
+import re
 import shutil
 import subprocess
 import sys
+import threading
 import time
+import torch
 
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from loguru import logger
 from sentiment_keywords import keyword_dict
 from tqdm import tqdm
 from transformers import pipeline, AutoTokenizer, AutoModelForSequenceClassification
 
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.append(parent_dir)
+from args import get_args
+
+# Lowercased keywords per category, built once at import instead of per transcript
+KEYWORDS_LOWER = {
+    key: tuple(keyword.lower() for keyword in keywords)
+    for key, keywords in keyword_dict.items()
+}
+# Single pattern matching any keyword, used to skip segments without keywords in one scan
+ANY_KEYWORD_PATTERN = re.compile(
+    "|".join(
+        re.escape(keyword)
+        for keywords in KEYWORDS_LOWER.values()
+        for keyword in keywords
+    )
+)
+# One pattern per category (combined categories have no keywords of their own), one scan per category
+CATEGORY_PATTERNS = {
+    key: re.compile("|".join(re.escape(keyword) for keyword in keywords))
+    for key, keywords in KEYWORDS_LOWER.items()
+    if keywords
+}
+
+# Transcript segments are short, longer sentences are truncated to this many tokens
+MAX_SEQUENCE_LENGTH = 128
+
+# Sentiment results of already analysed sentences, shared by all files processed in this run
+# Files are processed by several threads, so the cache is only accessed under its lock
+SENTIMENT_CACHE = {}
+SENTIMENT_CACHE_SIZE = 100_000
+SENTIMENT_CACHE_LOCK = threading.Lock()
+
+# The pipeline and its fast tokenizer are shared by all threads but are not thread safe,
+# so only one thread runs inference at a time
+SENTIMENT_PIPELINE_LOCK = threading.Lock()
+
 
 def get_processed_files(sentiment_buffer):
     folder_list = [
@@ -56,25 +98,59 @@ def chunk_list(lst, n):
     return [lst[i : i + chunk_size] for i in range(0, len(lst), chunk_size)]
 
 
+def get_sentiments(texts, sentiment_pipeline, batch_size=32):
+    """
+    Return a dict mapping each text to its (label, score) sentiment.
+    Radio transcripts repeat a lot of phrases (station ids, ads), so results are cached in SENTIMENT_CACHE
+    and only texts not seen before are passed through the sentiment pipeline.
+    """
+    sentiments = {}
+    new_texts = []
+    with SENTIMENT_CACHE_LOCK:
+        for text in dict.fromkeys(texts):
+            cached = SENTIMENT_CACHE.get(text)
+            if cached is None:
+                new_texts.append(text)
+            else:
+                sentiments[text] = cached
+
+    if new_texts:
+        with SENTIMENT_PIPELINE_LOCK, torch.inference_mode():
+            hf_results = sentiment_pipeline(
+                new_texts,
+                batch_size=batch_size,
+                truncation=True,
+                max_length=MAX_SEQUENCE_LENGTH,
+            )
+        for text, hf_result in zip(new_texts, hf_results):
+            sentiments[text] = (hf_result["label"], hf_result["score"])
+
+        # Evict the oldest entries once the cache is full
+        with SENTIMENT_CACHE_LOCK:
+            SENTIMENT_CACHE.update((text, sentiments[text]) for text in new_texts)
+            while len(SENTIMENT_CACHE) > SENTIMENT_CACHE_SIZE:
+                SENTIMENT_CACHE.pop(next(iter(SENTIMENT_CACHE)))
+
+    return sentiments
+
+
 def sentiment_analysis(
-    file_name, source_dir, dest_dir, sentiment_pipeline, keyword_dict
+    file_name, source_dir, dest_dir, sentiment_pipeline, keyword_dict, batch_size=32
 ):
     """
     Do sentiment analysis sentence by sentence, for sentences containing predefined keywords, and save the results in a json file.
+    Sentences containing keywords are collected first and passed through the sentiment pipeline in batches of "batch_size".
+    Keywords are matched using CATEGORY_PATTERNS, built from sentiment_keywords.keyword_dict at import.
     """
-    keywords_lower = {
-        key: [keyword.lower() for keyword in keywords]
-        for key, keywords in keyword_dict.items()
-    }
     local_path = os.path.join(source_dir, file_name)
 
     try:
-        with open(local_path, "r") as f:
-            transcript = json.load(f)
+        with open(local_path, "rb") as f:
+            transcript = orjson.loads(f.read())
     except FileNotFoundError:
         logger.error(f"Error: The file {local_path} was not found.")
         return None
-    except json.JSONDecodeError:
+    except orjson.JSONDecodeError:
         invalid_json_dir = "invalid_json_dir"
         logger.error(
             f"Error: The file {local_path} is not a valid JSON file. Moving it to {invalid_json_dir}."
@@ -95,55 +171,47 @@ def sentiment_analysis(
     day = name_details[4]
     hour = name_details[5]
     minute = name_details[6]
-    result = {key: [] for key in keyword_dict}
+    # Results are stored as parallel "label", "score" and "text" lists per keyword
+    result = {key: {"label": [], "score": [], "text": []} for key in keyword_dict}
     flags = {key: 0 for key in keyword_dict}  # Initialize flags for each category to 0
+
+    # Collect sentences with keywords along with the result keys they belong to
+    pending = []
     for seg in transcript:
         text = seg["text"].lower()
+        if not ANY_KEYWORD_PATTERN.search(text):
+            continue
 
-        for category, keywords in keywords_lower.items():
-            if any(keyword in text for keyword in keywords):
+        for category, pattern in CATEGORY_PATTERNS.items():
+            if pattern.search(text):
                 flags[category] = 1
+
+        result_keys = []
         if sum(flags.values()) == 1:
-            hf_result = sentiment_pipeline(text)[0]
-            for key, value in flags.items():
-                if value == 1:
-                    result[key].append(
-                        {
-                            "label": hf_result["label"],
-                            "score": hf_result["score"],
-                            "text": text,
-                        }
-                    )
-                    flags[key] = 0
+            result_keys = [key for key, value in flags.items() if value == 1]
         elif sum(flags.values()) > 1:
-            hf_result = sentiment_pipeline(text)[0]
             if flags["Biden"] == 1 and flags["Trump"] == 1:
-                result["Biden-Trump"].append(
-                    {
-                        "label": hf_result["label"],
-                        "score": hf_result["score"],
-                        "text": text,
-                    }
-                )
+                result_keys.append("Biden-Trump")
             if flags["Harris"] == 1 and flags["Trump"] == 1:
-                result["Harris-Trump"].append(
-                    {
-                        "label": hf_result["label"],
-                        "score": hf_result["score"],
-                        "text": text,
-                    }
-                )
+                result_keys.append("Harris-Trump")
             if flags["Democrats"] == 1 and flags["Republicans"] == 1:
-                result["Democrats-Republicans"].append(
-                    {
-                        "label": hf_result["label"],
-                        "score": hf_result["score"],
-                        "text": text,
-                    }
-                )
+                result_keys.append("Democrats-Republicans")
+
+        for key in flags:
+            flags[key] = 0
+        if result_keys:
+            pending.append((text, result_keys))
 
-            for key in flags:
-                flags[key] = 0
+    # Run sentiment analysis on all collected sentences in batches
+    sentiments = get_sentiments(
+        [text for text, _ in pending], sentiment_pipeline, batch_size
+    )
+    for text, result_keys in pending:
+        label, score = sentiments[text]
+        for key in result_keys:
+            result[key]["label"].append(label)
+            result[key]["score"].append(score)
+            result[key]["text"].append(text)
 
     # Write the result to a JSON file in the destination directory, create output folder (yyyy_mm_dd format) if not present in "dest_dir"
     output = {state: {call_sign: {f"{year}-{month}-{day}": result}}}
@@ -153,8 +221,8 @@ def sentiment_analysis(
     output_path = os.path.join(dest_dir, f"{year}_{month}_{day}", file_name)
 
     try:
-        with open(output_path, "w") as f:
-            json.dump(output, f, indent=4)
+        with open(output_path, "wb") as f:
+            f.write(orjson.dumps(output, option=orjson.OPT_INDENT_2))
     except IOError:
         logger.error(f"Error writing results to file {output_path}")
         return None
@@ -162,23 +230,32 @@ def sentiment_analysis(
     return output
 
 
-def process_all_files(source_dir, dest_dir, cache_dir, keyword_dict):
+def process_all_files(source_dir, dest_dir, cache_dir, keyword_dict, no_of_jobs=1):
     """
     Start multiple jobs in parallel for sentiment analysis.
+    Files are processed by "no_of_jobs" threads sharing a single sentiment pipeline, so reading and writing json files overlaps with inference.
     """
 
+    # Run inference on the first GPU in half precision if available, else on cpu
+    use_cuda = torch.cuda.is_available()
+    device = 0 if use_cuda else -1
+    torch_dtype = torch.float16 if use_cuda else torch.float32
+
     # Load the tokenizer and model with specified cache directory
     tokenizer = AutoTokenizer.from_pretrained(
         "cardiffnlp/twitter-roberta-base-sentiment-latest", cache_dir=cache_dir
     )
     model = AutoModelForSequenceClassification.from_pretrained(
-        "cardiffnlp/twitter-roberta-base-sentiment-latest", cache_dir=cache_dir
+        "cardiffnlp/twitter-roberta-base-sentiment-latest",
+        cache_dir=cache_dir,
+        torch_dtype=torch_dtype,
     )
 
     # Load the sentiment-analysis pipeline
     sentiment_pipeline = pipeline(
-        "sentiment-analysis", model=model, tokenizer=tokenizer
+        "sentiment-analysis", model=model, tokenizer=tokenizer, device=device
     )
+    logger.info(f"sentiment pipeline loaded on device: {sentiment_pipeline.device}")
 
     # Get all files unprocessed transcript files in the source directory
     unprocessed_file_list = get_unprocessed_files(dest_dir, source_dir)
@@ -187,13 +264,23 @@ def process_all_files(source_dir, dest_dir, cache_dir, keyword_dict):
         logger.info("no files pending sentiment analysis, exiting")
         return
 
-    logger.info(f"total files to process: {len(unprocessed_file_list)}")
-    # Process files one at a time
-    for i in tqdm(range(len(unprocessed_file_list)), desc="Processing files...."):
-        file_name = unprocessed_file_list[i]
-        result = sentiment_analysis(
-            file_name, source_dir, dest_dir, sentiment_pipeline, keyword_dict
-        )
+    logger.info(
+        f"total files to process: {len(unprocessed_file_list)}, parallel jobs: {no_of_jobs}"
+    )
+    sentiment_analysis_with_args = partial(
+        sentiment_analysis,
+        source_dir=source_dir,
+        dest_dir=dest_dir,
+        sentiment_pipeline=sentiment_pipeline,
+        keyword_dict=keyword_dict,
+    )
+    with ThreadPoolExecutor(max_workers=no_of_jobs) as executor:
+        for _ in tqdm(
+            executor.map(sentiment_analysis_with_args, unprocessed_file_list),
+            total=len(unprocessed_file_list),
+            desc="Processing files....",
+        ):
+            pass
 
 
 if __name__ == "__main__":
@@ -212,4 +299,7 @@ if __name__ == "__main__":
 
     logger.add(f"{log_path}/sentiment_analysis.log")
 
-    process_all_files(source_dir, dest_dir, cache_dir, keyword_dict)
+    # Keep this low if transcripts are stored on a HDD
+    no_of_jobs = get_args().no_of_jobs
+
+    process_all_files(source_dir, dest_dir, cache_dir, keyword_dict, no_of_jobs)
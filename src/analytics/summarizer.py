@@ -1,11 +1,16 @@
 import argparse
-import json
+import orjson
 import os
 import time
-import random
 import warnings
 
-from functools import wraps
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from tenacity import (
+    retry,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_exponential,
+)
 from tqdm import tqdm
 
 
@@ -14,6 +19,7 @@ warnings.simplefilter(action="ignore", category=FutureWarning)
 
 import google.generativeai as genai
 
+from google.api_core import exceptions as google_exceptions
 from google.generativeai.types import HarmCategory, HarmBlockThreshold
 
 api_key = str(os.environ["GCP_API_KEY"])
@@ -59,14 +65,28 @@ def get_summarization_prompt(new_content, prior_summary):
     return summarization_prompt
 
 
+# Transient API failures and malformed JSON responses are worth retrying
+RETRYABLE_EXCEPTIONS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.InternalServerError,
+    orjson.JSONDecodeError,
+)
+
+
+@retry(
+    wait=wait_exponential(multiplier=1, max=30),
+    stop=stop_after_attempt(5),
+    retry=retry_if_exception_type(RETRYABLE_EXCEPTIONS),
+    reraise=True,
+)
 def query_gcp_gemini_api(new_content, prior_summary):
-    # try:
     response = model.generate_content(
         get_summarization_prompt(new_content, prior_summary),
         safety_settings=safety_settings,
     )
-    response_dict = json.loads(response.text)
-    # except:
+    response_dict = orjson.loads(response.text)
     return response_dict
 
 
@@ -75,43 +95,24 @@ def read_json(json_file):
     Extracts conversation entries from a JSON file.
     """
     try:
-        with open(json_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        with open(json_file, "rb") as f:
+            data = orjson.loads(f.read())
         return data
     except Exception as e:
         print(f"Error reading or processing JSON file {json_file}: {e}")
         return None
 
 
-def retry_with_fixed_wait(func):
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        max_retries = kwargs.pop("retries", 5)
-        max_wait = 2  # Maximum wait time in seconds
-        for attempt in range(max_retries):
-            try:
-                return func(*args, **kwargs)
-            except Exception as e:
-                if attempt == max_retries - 1:
-                    raise
-                wait_time = min(max_wait, random.uniform(1, max_wait))
-                print(
-                    f"Attempt {attempt + 1} failed. Retrying in {wait_time:.2f} seconds..."
-                )
-                time.sleep(wait_time)
-
-    return wrapper
-
-
-# @retry_with_fixed_wait
 def generate_gemini_summary(new_content, prior_summary, retries, user):
     """
     Generate a summary using the Google Gemini API for a given text.
-    Implements retry logic with a fixed maximum wait time.
+    Transient failures are retried up to "retries" times with exponential backoff (capped at 30 seconds).
     """
     global platform
     try:
-        result = query_gcp_gemini_api(new_content, prior_summary)
+        result = query_gcp_gemini_api.retry_with(stop=stop_after_attempt(retries))(
+            new_content, prior_summary
+        )
         summary = result["summary"]
     except Exception as e:
         print(f"Exception: {e}")
@@ -124,8 +125,7 @@ def save_segments_to_file(summary, output_folder, filename_prefix):
     """
     Save conversation segments and their summaries to files.
     """
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
+    os.makedirs(output_folder, exist_ok=True)
 
     segment_filename = f"{filename_prefix}.txt"
     segment_path = os.path.join(output_folder, segment_filename)
@@ -138,38 +138,66 @@ def save_segments_to_file(summary, output_folder, filename_prefix):
         print(f"Error saving to {segment_path}: {e}")
 
 
-def summarize_transcripts(input_folder, output_folder, user):
+def summarize_file(filename, input_folder, output_folder, prior_summary, user):
+    """
+    Summarize a single transcript file and save the summary.
+    Returns True if the summary was saved.
+    """
+    filename_prefix = os.path.splitext(filename)[0]
+    json_file_path = os.path.join(input_folder, filename)
+
+    transcript = read_json(json_file_path)
+    if transcript is None:
+        return False
+
+    summary = generate_gemini_summary(transcript, prior_summary, retries=5, user=user)
+    if summary is None:
+        print(f"Failed {json_file_path} after multiple retries")
+        return False
+
+    save_segments_to_file(summary, output_folder, filename_prefix)
+    print("Processed Successfully: ", filename_prefix)
+    return True
+
+
+def summarize_transcripts(input_folder, output_folder, user, max_workers=16):
     """
     Processes conversation files, dynamically merges segments based on similarity, and limits processing to 20 files.
+    Gemini calls are network bound, so up to "max_workers" files are summarized concurrently.
     """
 
     start_time = time.time()
+    os.makedirs(output_folder, exist_ok=True)
     transcript_jsons = sorted(
         [f for f in os.listdir(input_folder) if f.endswith(".json")]
     )
+    pending_jsons = [
+        filename
+        for filename in transcript_jsons
+        if not os.path.isfile(
+            os.path.join(output_folder, f"{os.path.splitext(filename)[0]}.txt")
+        )
+    ]
     prior_summary = "None"  # Hardcoded disabled
-    with tqdm(total=len(transcript_jsons), desc="Processing Transcripts") as pbar:
-        for filename in transcript_jsons:
-            filename_prefix = os.path.splitext(filename)[0]
-            if os.path.isfile(os.path.join(output_folder, f"{filename_prefix}.txt")):
+    with tqdm(
+        total=len(transcript_jsons),
+        initial=len(transcript_jsons) - len(pending_jsons),
+        desc="Processing Transcripts",
+    ) as pbar:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(
+                    summarize_file,
+                    filename,
+                    input_folder,
+                    output_folder,
+                    prior_summary,
+                    user,
+                )
+                for filename in pending_jsons
+            ]
+            for _ in as_completed(futures):
                 pbar.update(1)
-                continue
-            # print(f"Processing conversation file: {filename}")
-            json_file_path = os.path.join(input_folder, filename)
-
-            transcript = read_json(json_file_path)
-            if transcript is None:
-                continue
-
-            summary = generate_gemini_summary(
-                transcript, prior_summary, retries=5, user=user
-            )
-            if summary is not None:
-                save_segments_to_file(summary, output_folder, filename_prefix)
-                print("Processed Successfully: ", filename_prefix)
-            else:
-                print(f"Failed {json_file_path} after multiple retries")
-            pbar.update(1)
 
     total_time = time.time() - start_time
     print(
@@ -201,6 +229,12 @@ def main():
         default=os.environ["USER"],
         help="Specify User for API access.",
     )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=int(os.environ.get("GEMINI_PARALLEL", 16)),
+        help="Number of transcripts summarized concurrently, keep within Gemini rate limits.",
+    )
     # Parse arguments
     args = parser.parse_args()
 
@@ -209,7 +243,7 @@ def main():
     user = args.user
 
     print(f"Starting to process transcripts from {input_folder}")
-    summarize_transcripts(input_folder, output_folder, user)
+    summarize_transcripts(input_folder, output_folder, user, args.max_workers)
     print("Completed summarizing all conversations.")
 
 
@@ -1,6 +1,7 @@
 import h5py
 from typing import List, Dict
 import torch
+from torch.utils.data import Dataset, DataLoader
 from transformers import AutoTokenizer, AutoModelForCausalLM
 from tqdm import tqdm
 import json
@@ -8,11 +9,20 @@ import os
 import argparse
 import re
 import logging
+import importlib.util
 from pathlib import Path
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
 )
+
+# Patterns used to pull the answer out of model responses
+_PREFILTER_RE = re.compile(r"mention_count|stolen|rigged", re.IGNORECASE)
+_JSON_RE = re.compile(r"\{.*?\}", re.DOTALL)
+_COUNT_RE = re.compile(r'mention_count"?\s*:\s*(\d+)')
+_STANCE_RE = re.compile(r'stance"?\s*:\s*"?(support|vanilla|debunk)', re.IGNORECASE)
+
+
 # Load document paths
 def load_document_paths(file_path: str) -> List[str]:
     with h5py.File(file_path, "r") as f:
@@ -20,11 +30,62 @@ def load_document_paths(file_path: str) -> List[str]:
     return filepaths
 
 
+class SummaryFileDataset(Dataset):
+    def __init__(self, filepaths: List[str], root_path: str):
+        self.root_path = root_path
+        self.items = []  # (original index, filepath, size in bytes)
+        for idx, filepath in enumerate(filepaths):
+            full_path = os.path.join(root_path, filepath.split("_")[1], filepath)
+            try:
+                size = os.stat(full_path).st_size
+            except FileNotFoundError:
+                logging.warning(f"File not found: {full_path}")
+                continue
+            self.items.append((idx, filepath, size))
+        # Bucket documents of similar length together to minimise padding per batch,
+        # using byte size as a proxy for token count
+        self.items.sort(key=lambda item: item[2])
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, i):
+        idx, filepath, _ = self.items[i]
+        full_path = os.path.join(self.root_path, filepath.split("_")[1], filepath)
+        try:
+            with open(full_path, "r", encoding="utf-8") as f:
+                content = f.read()
+        except Exception as e:
+            logging.error(f"Error reading file {full_path}: {str(e)}")
+            content = None
+        return idx, filepath, content
+
+
+def collate_documents(batch):
+    # Keep (index, filepath, content) tuples, dropping files that failed to read
+    return [item for item in batch if item[2] is not None]
+
+
 # Load LLM
-def load_llm(model_name: str):
+def load_llm(model_name: str, compile_model: bool = False, quantization: str = None):
     device = "cuda:0" if torch.cuda.is_available() else "cpu"
+    # Fused attention kernels: FlashAttention-2 when installed, PyTorch SDPA otherwise
+    attn_implementation = (
+        "flash_attention_2"
+        if device != "cpu" and importlib.util.find_spec("flash_attn") is not None
+        else "sdpa"
+    )
+    # AWQ int4 kernels run in fp16; the quantization config ships with the checkpoint
+    if quantization == "awq":
+        torch_dtype = torch.float16
+    else:
+        torch_dtype = torch.bfloat16 if device != "cpu" else torch.float32
     tokenizer = AutoTokenizer.from_pretrained(model_name)
-    model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=torch.float16)
+    model = AutoModelForCausalLM.from_pretrained(
+        model_name,
+        torch_dtype=torch_dtype,
+        attn_implementation=attn_implementation,
+    )
     model.to(device)
 
     # Fix for the padding token warning
@@ -32,12 +93,61 @@ def load_llm(model_name: str):
         tokenizer.pad_token = tokenizer.eos_token
         model.config.pad_token_id = model.config.eos_token_id
 
+    # Set generation defaults once instead of per generate call
+    model.generation_config.use_cache = True
+    model.generation_config.pad_token_id = tokenizer.pad_token_id
+
+    if compile_model and device != "cpu":
+        # Static KV cache keeps decode shapes fixed so the compiled step replays as a CUDA graph
+        model.generation_config.cache_implementation = "static"
+        model.forward = torch.compile(
+            model.forward, mode="reduce-overhead", fullgraph=True
+        )
+
     return tokenizer, model, device
 
 
+PROMPT_TEMPLATE = """
+    Analyze the following document summary regarding mentions of the 2020 election being stolen, rigged, or false.
+
+    Document summary:
+    {content}
+
+    Answer the following questions:
+    1. How many times was the 2020 election being stolen, rigged, or false mentioned?
+    2. Did the document support, vanilla report, or debunk these claims?
+
+    Provide your answer in the following format:
+        "mention_count": <number of mentions>,
+        "stance": "<support/vanilla/debunk>"
+    """
+
+
+# Load LLM with vLLM (optional dependency) for continuous batching
+def load_vllm(model_name: str, quantization: str = None):
+    from vllm import LLM, SamplingParams
+
+    llm = LLM(
+        model=model_name,
+        dtype="float16" if quantization == "awq" else "bfloat16",
+        quantization=quantization,
+        gpu_memory_utilization=0.9,
+        max_model_len=640,
+    )
+    # Greedy decoding; prompts are cut to 512 tokens like the HF path
+    sampling_params = SamplingParams(
+        max_tokens=100, temperature=0.0, truncate_prompt_tokens=512
+    )
+    return llm, sampling_params
+
+
 def parse_model_output(response: str) -> Dict:
+    # Responses that never mention the claim or the answer field carry no result
+    if not _PREFILTER_RE.search(response):
+        return None
+
     # Try to find a JSON-like structure in the response
-    match = re.search(r"\{.*\}", response, re.DOTALL)
+    match = _JSON_RE.search(response)
     if match:
         try:
             return json.loads(match.group())
@@ -49,7 +159,7 @@ def parse_model_output(response: str) -> Dict:
     stance = "unknown"
 
     # Look for mention count
-    count_match = re.search(r'mention_count"?\s*:\s*(\d+)', response)
+    count_match = _COUNT_RE.search(response)
     if count_match:
         mention_count = int(count_match.group(1))
 
@@ -57,9 +167,7 @@ def parse_model_output(response: str) -> Dict:
         return None
 
     # Look for stance
-    stance_match = re.search(
-        r'stance"?\s*:\s*"?(support|vanilla|debunk)', response, re.IGNORECASE
-    )
+    stance_match = _STANCE_RE.search(response)
     if stance_match:
         stance = stance_match.group(1).lower()
 
@@ -67,24 +175,13 @@ def parse_model_output(response: str) -> Dict:
 
 
 def analyze_batch(batch_content: List[str], tokenizer, model, device) -> List[Dict]:
-    prompt_template = """
-    Analyze the following document summary regarding mentions of the 2020 election being stolen, rigged, or false.
-
-    Document summary:
-    {content}
-
-    Answer the following questions:
-    1. How many times was the 2020 election being stolen, rigged, or false mentioned?
-    2. Did the document support, vanilla report, or debunk these claims?
-
-    Provide your answer in the following format:
-        "mention_count": <number of mentions>,
-        "stance": "<support/vanilla/debunk>"
-    """
-
-    prompts = [prompt_template.format(content=content) for content in batch_content]
+    prompts = [PROMPT_TEMPLATE.format(content=content) for content in batch_content]
     inputs = tokenizer(
-        prompts, return_tensors="pt", padding=True, truncation=True, max_length=512
+        prompts,
+        return_tensors="pt",
+        padding="longest",
+        truncation=True,
+        max_length=512,
     ).to(device)
 
     results = []
@@ -92,12 +189,14 @@ def analyze_batch(batch_content: List[str], tokenizer, model, device) -> List[Di
         with torch.no_grad():
             outputs = model.generate(**inputs, max_new_tokens=100)
 
-        responses = tokenizer.batch_decode(outputs, skip_special_tokens=True)
+        # Decode only the generated tokens, the prompt itself mentions every keyword
+        # the response prefilter looks for
+        responses = tokenizer.batch_decode(
+            outputs[:, inputs["input_ids"].shape[1] :], skip_special_tokens=True
+        )
 
-        for response in responses:
-            result = parse_model_output(response)
-            if result is not None:
-                results.append(result)
+        # One result per document, None included, so results line up with the batch
+        results = [parse_model_output(response) for response in responses]
     except Exception as e:
         logging.error(f"Error in model generation or parsing: {str(e)}")
         results = [{"mention_count": 0, "stance": "error"} for _ in batch_content]
@@ -105,36 +204,59 @@ def analyze_batch(batch_content: List[str], tokenizer, model, device) -> List[Di
     return results
 
 
-def analyze_dataset(
-    filepaths: List[str], root_path: str, model_name: str, batch_size: int
-):
-    tokenizer, model, device = load_llm(model_name)
-    results = []
+def analyze_with_vllm(contents: List[str], llm, sampling_params) -> List[Dict]:
+    prompts = [PROMPT_TEMPLATE.format(content=content) for content in contents]
+    # vLLM schedules all prompts internally, so submit them in one call
+    outputs = llm.generate(prompts, sampling_params)
+    return [parse_model_output(output.outputs[0].text) for output in outputs]
 
-    for i in tqdm(range(0, len(filepaths), batch_size), desc="Processing batches"):
-        batch_paths = filepaths[i : i + batch_size]
-        batch_content = []
-        valid_paths = []
 
-        for filepath in batch_paths:
-            full_path = os.path.join(root_path, filepath.split("_")[1], filepath)
-            if os.path.exists(full_path):
-                try:
-                    with open(full_path, "r", encoding="utf-8") as f:
-                        content = f.read()
-                    batch_content.append(content)
-                    valid_paths.append(filepath)
-                except Exception as e:
-                    logging.error(f"Error reading file {full_path}: {str(e)}")
-            else:
-                logging.warning(f"File not found: {full_path}")
-
-        if batch_content:
-            batch_results = analyze_batch(batch_content, tokenizer, model, device)
-            for filepath, analysis in zip(valid_paths, batch_results):
-                results.append({"filepath": filepath, "analysis": analysis})
-
-    return results
+def analyze_dataset(
+    filepaths: List[str],
+    root_path: str,
+    model_name: str,
+    batch_size: int,
+    compile_model: bool = False,
+    backend: str = "hf",
+    quantization: str = None,
+    num_workers: int = 8,
+):
+    # Worker processes read the next batches from disk while the GPU is busy
+    dataloader = DataLoader(
+        SummaryFileDataset(filepaths, root_path),
+        batch_size=batch_size,
+        num_workers=num_workers,
+        prefetch_factor=2 if num_workers > 0 else None,
+        collate_fn=collate_documents,
+    )
+    indexed_results = []
+
+    if backend == "vllm":
+        documents = [item for batch in dataloader for item in batch]
+        llm, sampling_params = load_vllm(model_name, quantization)
+        analyses = analyze_with_vllm(
+            [content for _, _, content in documents], llm, sampling_params
+        )
+        for (idx, filepath, _), analysis in zip(documents, analyses):
+            indexed_results.append((idx, {"filepath": filepath, "analysis": analysis}))
+    else:
+        tokenizer, model, device = load_llm(model_name, compile_model, quantization)
+
+        for batch in tqdm(dataloader, desc="Processing batches"):
+            if not batch:
+                continue
+            batch_idx, batch_paths, batch_content = zip(*batch)
+            batch_results = analyze_batch(
+                list(batch_content), tokenizer, model, device
+            )
+            for idx, filepath, analysis in zip(batch_idx, batch_paths, batch_results):
+                indexed_results.append(
+                    (idx, {"filepath": filepath, "analysis": analysis})
+                )
+
+    # Restore the original document order
+    indexed_results.sort(key=lambda item: item[0])
+    return [result for _, result in indexed_results]
 
 
 # Save results
@@ -155,6 +277,29 @@ if __name__ == "__main__":
         default=8,
         help="Batch size for processing documents",
     )
+    parser.add_argument(
+        "--compile",
+        action="store_true",
+        help="Compile the decode step with CUDA graphs (static KV cache)",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["hf", "vllm"],
+        default="hf",
+        help="Inference backend: Hugging Face generate or vLLM",
+    )
+    parser.add_argument(
+        "-m",
+        "--model_name",
+        default="meta-llama/Llama-3.1-8B-Instruct",
+        help="Model to load, e.g. a pre-quantized AWQ checkpoint",
+    )
+    parser.add_argument(
+        "--quantization",
+        choices=["awq"],
+        default=None,
+        help="Quantization of the checkpoint given by --model_name",
+    )
     args = parser.parse_args()
 
     embeddings_file_idx = int(args.input)
@@ -163,13 +308,20 @@ if __name__ == "__main__":
     embeddings_file = str(
         list(Path(root_path).glob("embeddings_*.h5"))[embeddings_file_idx].name
     )
-    model_name = "meta-llama/Llama-3.1-8B-Instruct"
     call_sign = embeddings_file[11:-3]
     output_file = f"election_2020_{call_sign}.json"
     print(f"Doing File: {embeddings_file}")
 
     filepaths = load_document_paths(embeddings_file)
-    results = analyze_dataset(filepaths, summary_root_path, model_name, args.batch_size)
+    results = analyze_dataset(
+        filepaths,
+        summary_root_path,
+        args.model_name,
+        args.batch_size,
+        args.compile,
+        args.backend,
+        args.quantization,
+    )
     save_results(results, output_file)
 
     print(f"Analysis complete. Results saved to {output_file}")
@@ -11,11 +11,14 @@ warnings.simplefilter(action="ignore", category=FutureWarning)
 class SummaryDataset(Dataset):
     def __init__(self, folder_path, existing_files):
         self.folder_path = folder_path
-        self.file_names = [
-            f
-            for f in os.listdir(folder_path)
-            if f.endswith(".txt") and f not in existing_files
-        ]
+        with os.scandir(folder_path) as entries:
+            txt_files = {
+                entry.name
+                for entry in entries
+                if entry.name.endswith(".txt") and entry.is_file()
+            }
+        # Sorted for a reproducible batch order
+        self.file_names = sorted(txt_files - set(existing_files))
 
     def __len__(self):
         return len(self.file_names)
@@ -32,6 +35,101 @@ import numpy as np
 import h5py
 from tqdm import tqdm
 
+# Rows per HDF5 chunk for the per-document datasets
+CHUNK_ROWS = 1000
+
+
+def pad_colbert_embeddings(colbert_embeddings, max_tokens):
+    """
+    Quantize per-document ColBERT vectors to int8 in one zero-padded slab.
+    A document is recovered as padded[i, :lengths[i]] * scales[i]
+    """
+    dim = colbert_embeddings[0].shape[1]
+    padded = np.zeros((len(colbert_embeddings), max_tokens, dim), dtype=np.int8)
+    lengths = np.empty(len(colbert_embeddings), dtype=np.int32)
+    scales = np.empty(len(colbert_embeddings), dtype=np.float32)
+    for i, emb in enumerate(colbert_embeddings):
+        scale = np.abs(emb).max() / 127 or 1.0
+        padded[i, : emb.shape[0]] = np.round(emb / scale)
+        lengths[i] = emb.shape[0]
+        scales[i] = scale
+    return padded, lengths, scales
+
+
+def create_datasets(f, dense_embeddings, colbert_embeddings):
+    """
+    Create empty resizable datasets shaped after the first batch
+    """
+    dense_dim = dense_embeddings.shape[1]
+    max_tokens = max(emb.shape[0] for emb in colbert_embeddings)
+    colbert_dim = colbert_embeddings[0].shape[1]
+
+    f.create_dataset(
+        "dense_embeddings",
+        (0, dense_dim),
+        dtype=dense_embeddings.dtype,
+        maxshape=(None, dense_dim),
+        chunks=(CHUNK_ROWS, dense_dim),
+    )
+    # Padded (docs, tokens, dim) int8 dataset with per-document lengths and scales
+    f.create_dataset(
+        "colbert_embeddings",
+        (0, max_tokens, colbert_dim),
+        dtype="i1",
+        maxshape=(None, None, colbert_dim),
+        chunks=(64, max_tokens, colbert_dim),
+    )
+    f.create_dataset(
+        "colbert_lengths",
+        (0,),
+        dtype=np.int32,
+        maxshape=(None,),
+        chunks=(CHUNK_ROWS,),
+    )
+    f.create_dataset(
+        "colbert_scales",
+        (0,),
+        dtype=np.float32,
+        maxshape=(None,),
+        chunks=(CHUNK_ROWS,),
+    )
+    f.create_dataset(
+        "filepaths",
+        (0,),
+        maxshape=(None,),
+        chunks=(CHUNK_ROWS,),
+        dtype=h5py.special_dtype(vlen=str),
+    )
+
+
+def append_batch(f, dense_embeddings, colbert_embeddings, filenames):
+    """
+    Grow every dataset by one batch and write it in place
+    """
+    current_size = f["dense_embeddings"].shape[0]
+    new_size = current_size + len(filenames)
+
+    f["dense_embeddings"].resize((new_size, dense_embeddings.shape[1]))
+    f["dense_embeddings"][current_size:new_size] = dense_embeddings
+
+    padded_colbert, colbert_lengths, colbert_scales = pad_colbert_embeddings(
+        colbert_embeddings, max(emb.shape[0] for emb in colbert_embeddings)
+    )
+    # Widen the token axis if this batch has longer documents
+    colbert = f["colbert_embeddings"]
+    max_tokens = max(colbert.shape[1], padded_colbert.shape[1])
+    colbert.resize((new_size, max_tokens, colbert.shape[2]))
+    colbert[current_size:new_size, : padded_colbert.shape[1]] = padded_colbert
+
+    f["colbert_lengths"].resize((new_size,))
+    f["colbert_lengths"][current_size:new_size] = colbert_lengths
+
+    f["colbert_scales"].resize((new_size,))
+    f["colbert_scales"][current_size:new_size] = colbert_scales
+
+    f["filepaths"].resize((new_size,))
+    f["filepaths"][current_size:new_size] = filenames
+
 
 def process_folder(args):
     output_file = f"embeddings_{os.path.basename(args.input_folder)}.h5"
@@ -39,7 +137,6 @@ def process_folder(args):
     # Check for existing embeddings
     existing_files = set()
     mode = "a"  # Default to append mode
-    current_size = 0  # Initialize current_size to 0
 
     if os.path.exists(output_file):
         with h5py.File(output_file, "r") as f:
@@ -54,10 +151,12 @@ def process_folder(args):
                         "Existing datasets are not chunked. Creating a new file with chunked datasets."
                     )
                     mode = "w"  # Switch to write mode to create a new file
-                else:
-                    current_size = f["dense_embeddings"].shape[
-                        0
-                    ]  # Set current_size if file exists
+                elif f["colbert_embeddings"].dtype != np.int8:
+                    print(
+                        "Existing ColBERT embeddings are not int8 quantized. Re-embedding into a padded int8 dataset."
+                    )
+                    mode = "w"
+                    existing_files = set()  # Rewritten file must hold every summary
 
     dataset = SummaryDataset(args.input_folder, existing_files)
     if len(dataset) == 0:
@@ -69,92 +168,35 @@ def process_folder(args):
         dataset, batch_size=args.batch_size, num_workers=4, pin_memory=True
     )
 
-    new_dense_embeddings = []
-    new_colbert_embeddings = []
-    new_filenames = []
-
-    for summaries, filenames in tqdm(dataloader,
-                                     desc="Processing new summaries"):
-        outputs = model.encode(
-            summaries,
-            batch_size=len(summaries),
-            max_length=args.max_length,
-            return_dense=True,
-            return_sparse=False,
-            return_colbert_vecs=True,
-        )
-        new_dense_embeddings.append(outputs["dense_vecs"])
-        new_colbert_embeddings.extend(
-            outputs["colbert_vecs"]
-        )  # Extend instead of append
-        new_filenames.extend(filenames)
-
-    if not new_dense_embeddings or not new_colbert_embeddings:
-        print("No new embeddings were generated. Exiting.")
-        return
-
-    new_dense_embeddings = np.concatenate(new_dense_embeddings, axis=0)
-
-    with h5py.File(output_file, mode) as f:
-        if "dense_embeddings" not in f or "colbert_embeddings" not in f or mode == "w":
-            # Create new datasets
-            chunk_size = min(
-                1000, new_dense_embeddings.shape[0]
-            )  # Adjust chunk size as needed
-            f.create_dataset(
-                "dense_embeddings",
-                data=new_dense_embeddings,
-                maxshape=(None, new_dense_embeddings.shape[1]),
-                chunks=(chunk_size, new_dense_embeddings.shape[1]),
+    processed = 0
+    # Larger chunk cache so per-batch appends don't thrash chunk reads
+    with h5py.File(output_file, mode, libver="latest", rdcc_nbytes=64 << 20) as f:
+        for summaries, filenames in tqdm(dataloader, desc="Processing new summaries"):
+            outputs = model.encode(
+                summaries,
+                batch_size=len(summaries),
+                max_length=args.max_length,
+                return_dense=True,
+                return_sparse=False,
+                return_colbert_vecs=True,
             )
-
-            # Create a variable-length dataset for ColBERT embeddings
-            colbert_dtype = h5py.special_dtype(vlen=np.dtype("float32"))
-            f.create_dataset(
-                "colbert_embeddings",
-                (len(new_colbert_embeddings),),
-                dtype=colbert_dtype,
-                maxshape=(None,),
-                chunks=(chunk_size,),
+            if "dense_embeddings" not in f or "colbert_embeddings" not in f:
+                create_datasets(f, outputs["dense_vecs"], outputs["colbert_vecs"])
+            # Write each batch straight to disk instead of concatenating in memory
+            append_batch(
+                f, outputs["dense_vecs"], outputs["colbert_vecs"], list(filenames)
             )
+            processed += len(filenames)
 
-            f.create_dataset(
-                "filepaths",
-                data=new_filenames,
-                maxshape=(None,),
-                chunks=(chunk_size,),
-                dtype=h5py.special_dtype(vlen=str),
-            )
-
-            current_size = 0  # Reset current_size to 0 for new datasets
-        else:
-            # Append to existing datasets
-            current_size = f["dense_embeddings"].shape[0]
-            new_size = current_size + new_dense_embeddings.shape[0]
-
-            f["dense_embeddings"].resize(
-                (new_size, new_dense_embeddings.shape[1]))
-            f["dense_embeddings"][current_size:] = new_dense_embeddings
-
-            f["colbert_embeddings"].resize(
-                (f["colbert_embeddings"].shape[0] + len(
-                    new_colbert_embeddings),)
-            )
-            f["filepaths"].resize(
-                (f["filepaths"].shape[0] + len(new_filenames),))
-
-        # Store ColBERT embeddings
-        for i, emb in enumerate(new_colbert_embeddings):
-            f["colbert_embeddings"][
-                current_size + i
-                ] = emb.flatten()  # Store as 1D array
-
-        f["filepaths"][current_size:] = new_filenames
+        if processed == 0:
+            print("No new embeddings were generated. Exiting.")
+            return
+        dense_shape = f["dense_embeddings"].shape
 
     print(f"Embeddings saved to {output_file}")
-    print(f"Processed {len(new_filenames)} new files.")
-    print(f"Dense embedding shape: {new_dense_embeddings.shape}")
-    print(f"ColBERT embeddings stored as variable-length arrays.")
+    print(f"Processed {processed} new files.")
+    print(f"Dense embedding shape: {dense_shape}")
+    print(f"ColBERT embeddings stored as padded int8 arrays with per-document scales.")
 
 
 if __name__ == "__main__":
@@ -1,15 +1,33 @@
 """
 Run this if you have erroneous vector database
 The code loads the embeddings (whichever exists) and then saves them after reshaping.
+ColBERT vectors in older float layouts are converted to the padded int8 layout that
+embed_summaries.py writes, so every file ends up in the same format.
 """
 import os
 import argparse
 import numpy as np
 import h5py
+from embed_summaries import pad_colbert_embeddings
 from tqdm import tqdm
 
+# Per-token ColBERT vector size of BGE-M3
+COLBERT_DIM = 1024
 
-def fix_h5_file(input_file, output_file):
+
+def unpad_colbert_embeddings(padded):
+    """
+    Split a zero-padded (docs, tokens, dim) array into per-document (tokens, dim)
+    arrays, dropping the all-zero padding rows at the end of each document
+    """
+    nonzero_tokens = np.any(padded != 0, axis=2)
+    last_token = padded.shape[1] - np.argmax(nonzero_tokens[:, ::-1], axis=1)
+    # Documents without any vector keep one zero row so they can still be quantized
+    lengths = np.where(nonzero_tokens.any(axis=1), last_token, 1)
+    return [doc[:length] for doc, length in zip(padded, lengths)]
+
+
+def fix_h5_file(input_file, output_file, colbert_dim=COLBERT_DIM):
     try:
         with h5py.File(input_file, "r") as f:
             # Check if required datasets exist
@@ -24,23 +42,34 @@ def fix_h5_file(input_file, output_file):
             colbert_embeddings = f["colbert_embeddings"][:]
             filepaths = f["filepaths"][:]
 
-            # Check and fix ColBERT embeddings shape
-            if len(colbert_embeddings.shape) == 1:
-                # Reshape to 2D if it's 1D
-                colbert_dim = colbert_embeddings[0].shape[0]
-                colbert_embeddings = np.array(
-                    [emb.reshape(-1, colbert_dim) for emb in colbert_embeddings]
-                )
-            elif len(colbert_embeddings.shape) == 3:
-                # Flatten if it's 3D
-                colbert_embeddings = colbert_embeddings.reshape(
-                    colbert_embeddings.shape[0], -1
+            if "colbert_lengths" in f and "colbert_scales" in f:
+                # Already in the padded int8 layout, copied through unchanged
+                colbert_lengths = f["colbert_lengths"][:]
+                colbert_scales = f["colbert_scales"][:]
+            else:
+                if len(colbert_embeddings.shape) == 1:
+                    # Variable-length rows, one flattened array per document
+                    documents = [
+                        emb.reshape(-1, colbert_dim) for emb in colbert_embeddings
+                    ]
+                else:
+                    # Zero-padded float rows, 3D or flattened to 2D
+                    documents = unpad_colbert_embeddings(
+                        colbert_embeddings.reshape(
+                            colbert_embeddings.shape[0], -1, colbert_dim
+                        )
+                    )
+                max_tokens = max(emb.shape[0] for emb in documents)
+                colbert_embeddings, colbert_lengths, colbert_scales = (
+                    pad_colbert_embeddings(documents, max_tokens)
                 )
 
         # Write fixed data to new file
         with h5py.File(output_file, "w") as f_out:
             f_out.create_dataset("dense_embeddings", data=dense_embeddings)
             f_out.create_dataset("colbert_embeddings", data=colbert_embeddings)
+            f_out.create_dataset("colbert_lengths", data=colbert_lengths)
+            f_out.create_dataset("colbert_scales", data=colbert_scales)
             f_out.create_dataset("filepaths", data=filepaths)
 
         print(f"Fixed file saved as {output_file}")
@@ -5,6 +5,10 @@ import h5py
 import numpy as np
 import argparse
 
+# Rows per block when computing norms, keeps temporaries cache-sized
+NORM_CHUNK_ROWS = 65536
+
+
 # Import visualization libraries only if needed
 def import_viz_libraries():
     global plt, TSNE, PCA
@@ -25,8 +29,17 @@ def summarize_embeddings(embeddings, filepaths, visualize=False):
     print(f"Total number of embeddings: {total_embeddings}")
     print(f"Embedding dimension: {embeddings.shape[1]}")
 
-    # Basic statistics
-    embedding_norms = np.linalg.norm(embeddings, axis=1)
+    # Basic statistics, norms computed blockwise without an (N, d) temporary. Sums of
+    # squares are accumulated in float32, fp16 embeddings would lose precision or
+    # overflow over 1024 dimensions
+    embedding_norms = np.empty(total_embeddings, dtype=np.float32)
+    for start in range(0, total_embeddings, NORM_CHUNK_ROWS):
+        block = embeddings[start : start + NORM_CHUNK_ROWS].astype(
+            np.float32, copy=False
+        )
+        embedding_norms[start : start + len(block)] = np.sqrt(
+            np.einsum("ij,ij->i", block, block)
+        )
     print(f"\nEmbedding norms summary:")
     print(f"  Min: {embedding_norms.min():.4f}")
     print(f"  Max: {embedding_norms.max():.4f}")
@@ -3,12 +3,51 @@ Update existing embeddings or merge multiple vector databases.
 """
 import os
 import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import numpy as np
 import h5py
 from tqdm import tqdm
 
+# Rows copied per block when a source dataset cannot be memory-mapped
+COPY_BLOCK_ROWS = 65536
 
-def merge_embeddings(input_files, output_file):
+
+def copy_dense_embeddings(src, dest, dest_offset, buffer):
+    """
+    Copy a source dense dataset into dest without materialising it in full
+    """
+    count = src.shape[0]
+    if count == 0:
+        return
+    offset = src.id.get_offset()
+    if src.chunks is None and offset is not None:
+        # Contiguous on disk: map the file region and write it straight through
+        mapped = np.memmap(
+            src.file.filename, dtype=src.dtype, mode="r", offset=offset, shape=src.shape
+        )
+        dest.write_direct(mapped, dest_sel=np.s_[dest_offset : dest_offset + count])
+        return
+
+    # Chunked: stream blocks through one reusable buffer
+    for start in range(0, count, COPY_BLOCK_ROWS):
+        rows = min(COPY_BLOCK_ROWS, count - start)
+        src.read_direct(buffer, np.s_[start : start + rows], np.s_[:rows])
+        dest.write_direct(
+            buffer,
+            np.s_[:rows],
+            np.s_[dest_offset + start : dest_offset + start + rows],
+        )
+
+
+def read_embeddings_file(input_file):
+    """
+    Load one source file's dense embeddings and filepaths (runs in a worker)
+    """
+    with h5py.File(input_file, "r") as f:
+        return f["dense_embeddings"][:], f["filepaths"][:]
+
+
+def merge_embeddings(input_files, output_file, workers=1):
     all_dense_embeddings = []
     all_filepaths = []
 
@@ -16,11 +55,13 @@ def merge_embeddings(input_files, output_file):
     total_dense = 0
     dense_dim = None
     skipped_files = []
+    file_offsets = []  # (input_file, row offset in the merged output)
 
     for input_file in tqdm(input_files, desc="Calculating sizes"):
         try:
             with h5py.File(input_file, "r") as f:
                 if "dense_embeddings" in f:
+                    file_offsets.append((input_file, total_dense))
                     total_dense += f["dense_embeddings"].shape[0]
                     if dense_dim is None:
                         dense_dim = f["dense_embeddings"].shape[1]
@@ -40,31 +81,51 @@ def merge_embeddings(input_files, output_file):
     # Create the output file with pre-allocated datasets
     with h5py.File(output_file, "w") as out_f:
         dense_dset = out_f.create_dataset(
-            "dense_embeddings", shape=(total_dense, dense_dim), dtype=np.float32
+            "dense_embeddings", shape=(total_dense, dense_dim), dtype=np.float16
         )
         filepath_dset = out_f.create_dataset(
             "filepaths", shape=(total_dense,), dtype=h5py.special_dtype(vlen=str)
         )
 
         # Second pass: copy data
-        dense_offset = 0
-        for input_file in tqdm(input_files, desc="Merging files"):
-            if input_file in skipped_files:
-                continue
-            try:
-                with h5py.File(input_file, "r") as f:
-                    dense_count = f["dense_embeddings"].shape[0]
-
-                    dense_dset[dense_offset : dense_offset + dense_count] = f[
-                        "dense_embeddings"
-                    ][:]
-                    filepath_dset[dense_offset : dense_offset + dense_count] = f[
-                        "filepaths"
-                    ][:]
-
-                    dense_offset += dense_count
-            except Exception as e:
-                print(f"Error processing file {input_file}: {str(e)}")
+        if workers > 1:
+            # Read files in parallel worker processes; this process is the only writer
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {
+                    executor.submit(read_embeddings_file, input_file): (
+                        input_file,
+                        dense_offset,
+                    )
+                    for input_file, dense_offset in file_offsets
+                }
+                for future in tqdm(
+                    as_completed(futures), total=len(futures), desc="Merging files"
+                ):
+                    input_file, dense_offset = futures[future]
+                    try:
+                        dense, filepaths = future.result()
+                        dense_count = dense.shape[0]
+                        dense_dset[dense_offset : dense_offset + dense_count] = dense
+                        filepath_dset[
+                            dense_offset : dense_offset + dense_count
+                        ] = filepaths
+                    except Exception as e:
+                        print(f"Error processing file {input_file}: {str(e)}")
+        else:
+            buffer = np.empty((COPY_BLOCK_ROWS, dense_dim), dtype=np.float16)
+            for input_file, dense_offset in tqdm(file_offsets, desc="Merging files"):
+                try:
+                    with h5py.File(input_file, "r") as f:
+                        dense_count = f["dense_embeddings"].shape[0]
+
+                        copy_dense_embeddings(
+                            f["dense_embeddings"], dense_dset, dense_offset, buffer
+                        )
+                        filepath_dset[dense_offset : dense_offset + dense_count] = f[
+                            "filepaths"
+                        ][:]
+                except Exception as e:
+                    print(f"Error processing file {input_file}: {str(e)}")
 
     print(f"Merged embeddings saved to {output_file}")
     print(f"Total dense embeddings: {total_dense}")
@@ -88,6 +149,13 @@ if __name__ == "__main__":
         default="merged_dense_embeddings.h5",
         help="Output file for merged embeddings.",
     )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes reading input files in parallel.",
+    )
     args = parser.parse_args()
 
     input_files = [
@@ -99,4 +167,4 @@ if __name__ == "__main__":
     if not input_files:
         print("No H5 files found in the input directory.")
     else:
-        merge_embeddings(input_files, args.output_file)
+        merge_embeddings(input_files, args.output_file, args.workers)
@@ -3,6 +3,7 @@ import faiss
 import h5py
 from typing import List, Tuple
 import torch
+import torch.nn.functional as F
 from transformers import AutoTokenizer, AutoModel, AutoModelForCausalLM, pipeline
 from langchain_huggingface import HuggingFacePipeline
 from langchain.prompts import ChatPromptTemplate
@@ -10,63 +11,123 @@ from langchain.schema import StrOutputParser
 from langchain.schema.runnable import RunnablePassthrough, RunnableLambda
 import argparse
 import os
+from functools import lru_cache
 
 
 # Load the merged embeddings
 def load_embeddings(file_path: str) -> Tuple[np.ndarray, List[str]]:
     with h5py.File(file_path, "r") as f:
-        embeddings = f["dense_embeddings"][:]
+        dense = f["dense_embeddings"]
+        # Read straight into a float32 array, the dtype FAISS expects
+        embeddings = np.empty(dense.shape, dtype=np.float32)
+        dense.read_direct(embeddings)
         filepaths = [path.decode("utf-8") for path in f["filepaths"][:]]
     return embeddings, filepaths
 
 
+# HNSW graph parameters: neighbours per node and build-time search depth
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+
+
 # Initialize FAISS index
-def init_faiss_index(embeddings: np.ndarray) -> faiss.IndexFlatIP:
+def init_faiss_index(embeddings: np.ndarray) -> faiss.IndexHNSWSQ:
     dimension = embeddings.shape[1]
-    index = faiss.IndexFlatIP(dimension)
+    # Approximate graph index keeps queries sub-linear instead of a full flat scan;
+    # vectors are stored as fp16 to halve the bytes read per comparison
+    index = faiss.IndexHNSWSQ(
+        dimension,
+        faiss.ScalarQuantizer.QT_fp16,
+        HNSW_M,
+        faiss.METRIC_INNER_PRODUCT,
+    )
+    index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
     faiss.normalize_L2(embeddings)  # Normalize vectors before adding to the index
+    index.train(embeddings)
     index.add(embeddings)
     return index
 
 
+# BGE-M3's input limit, longer queries are truncated to it
+QUERY_MAX_LENGTH = 8192
+# Queries are padded to the longest in the batch, rounded up to a multiple of this, so
+# the compiled encoder only sees a few distinct shapes
+QUERY_PAD_MULTIPLE = 64
+
+
+# Load the BGE-M3 query encoder once per process
+@lru_cache(maxsize=1)
+def load_bge_encoder():
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    tokenizer = AutoTokenizer.from_pretrained("BAAI/bge-m3")
+    model = (
+        AutoModel.from_pretrained("BAAI/bge-m3", attn_implementation="sdpa")
+        .to(device)
+        .eval()
+    )
+    if device.type == "cuda":
+        # Fuse ops and replay the forward pass as a CUDA graph
+        model = torch.compile(model, mode="reduce-overhead", dynamic=False)
+    return tokenizer, model, device
+
+
 # Custom retriever class
 class CustomRetriever:
     def __init__(
         self,
-        index: faiss.IndexFlatIP,
+        index: faiss.IndexHNSWSQ,
         embeddings: np.ndarray,
         filepaths: List[str],
         k: int = 4,
     ):
         self.index = index
         self.embeddings = embeddings
-        self.filepaths = filepaths
+        # Object array, so search results map to paths without rebuilding it per query
+        self.filepaths = np.asarray(filepaths, dtype=object)
         self.k = k
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.tokenizer = AutoTokenizer.from_pretrained("BAAI/bge-m3")
-        self.model = AutoModel.from_pretrained("BAAI/bge-m3").to(self.device)
+        self.tokenizer, self.model, self.device = load_bge_encoder()
 
     def get_relevant_documents(self, query: str) -> List[str]:
+        return self.get_relevant_documents_batch([query])[0]
+
+    def get_relevant_documents_batch(self, queries: List[str]) -> List[List[str]]:
+        # Encode all queries in one forward pass and search them together
         encoded_input = self.tokenizer(
-            query, padding=True, truncation=True, return_tensors="pt"
+            queries,
+            padding="longest",
+            pad_to_multiple_of=QUERY_PAD_MULTIPLE,
+            truncation=True,
+            max_length=QUERY_MAX_LENGTH,
+            return_tensors="pt",
         ).to(self.device)
+        query_lengths = encoded_input["attention_mask"].sum(dim=1).tolist()
+        for query, length in zip(queries, query_lengths):
+            if length >= QUERY_MAX_LENGTH:
+                print(f"Query truncated to {QUERY_MAX_LENGTH} tokens: {query[:50]}")
         with torch.no_grad():
             model_output = self.model(**encoded_input)
-            embedding = model_output.last_hidden_state[:, 0, :].cpu().numpy()
-        faiss.normalize_L2(embedding)
-        distances, indices = self.index.search(embedding, self.k)
-        return [self.filepaths[i] for i in indices[0]]
+            # Normalise on the encoder's device and copy to host once
+            embeddings = (
+                F.normalize(model_output.last_hidden_state[:, 0, :], p=2, dim=1)
+                .cpu()
+                .numpy()
+            )
+        # Search depth must be at least k for HNSW to return k neighbours
+        self.index.hnsw.efSearch = max(64, self.k)
+        distances, indices = self.index.search(embeddings, self.k)
+        return np.take(self.filepaths, indices).tolist()
 
 
 # Load embeddings and initialize FAISS index
 embeddings, filepaths = load_embeddings("./merged_temp.h5")
 index = init_faiss_index(embeddings)
 
-# Initialize custom retriever
-retriever = CustomRetriever(index, embeddings, filepaths, k=250)
+# Custom retriever, created in __main__ once k is known
+retriever = None
 
 # Initialize a more powerful language model
-model_name = "meta-llama/Llama-3.1-8B-Instruct"
+# Point RAG_MODEL_NAME at a pre-quantized (e.g. AWQ int4) checkpoint to cut weight traffic
+model_name = os.environ.get("RAG_MODEL_NAME", "meta-llama/Llama-3.1-8B-Instruct")
 root_path = "/vast/gm2724/transcripts_summarized"
 
 tokenizer = AutoTokenizer.from_pretrained(model_name)
@@ -103,13 +164,17 @@ Answer:"""
 rag_prompt = ChatPromptTemplate.from_template(RAG_TEMPLATE)
 
 
+# Cache summaries so repeated retrievals skip the network filesystem
+@lru_cache(maxsize=4096)
+def read_doc(root_path: str, doc: str) -> str:
+    with open(f"{root_path}/{doc.split('_')[1]}/{doc}", "r", encoding="utf-8") as f:
+        return f.read()
+
+
 # Define document formatting function
 def format_docs(docs: List[str]) -> str:
     print("Docs used:", docs)
-    docs = [
-        doc + ":\n\n" + open(f"{root_path}/{doc.split('_')[1]}/{doc}").read()
-        for doc in docs
-    ]
+    docs = [doc + ":\n\n" + read_doc(root_path, doc) for doc in docs]
     return "\n\n".join(docs)
 
 
@@ -124,12 +189,8 @@ def dump_retrieved_docs(query: str, docs: List[str], root_path: str):
         f.write(f"Query: {query}\n\n")
         for doc in docs:
             f.write(f"Document: {doc}\n")
-            with open(
-                f"{root_path}/{doc.split('_')[1]}/{doc}", "r", encoding="utf-8"
-            ) as doc_file:
-                content = doc_file.read()
             f.write("Content:\n")
-            f.write(content)
+            f.write(read_doc(root_path, doc))
             f.write("\n\n" + "-" * 50 + "\n\n")
 
     print(f"Dumped retrieved documents to {file_name}")
@@ -9,9 +9,152 @@ import torch
 # Standard libraries
 from argparse import ArgumentParser
 from datetime import datetime, timedelta
-
-
-def get_args():
+from functools import lru_cache
+
+# Default keywords used to keep only political fact-check articles
+_POLITICAL_KEYWORDS = (
+    "politics",
+    "election",
+    "government",
+    "policy",
+    "politician",
+    "senate",
+    "congress",
+    "president",
+    "pelosi",
+    "campaign",
+    "vote",
+    "democracy",
+    "legislation",
+    "parliament",
+    "minister",
+    "diplomacy",
+    "administration",
+    "law",
+    "regulation",
+    "governance",
+    "political",
+    "party",
+    "national",
+    "immigration",
+    "health",
+    "biden",
+    "trump",
+    "presidential",
+    "debate",
+    "liberal",
+    "conservative",
+    "republican",
+    "democrat",
+    "socialism",
+    "capitalism",
+    "justice",
+    "equality",
+    "freedom",
+    "rights",
+    "liberty",
+    "economy",
+    "tax",
+    "budget",
+    "foreign",
+    "domestic",
+    "trade",
+    "war",
+    "peace",
+    "security",
+    "defense",
+    "environment",
+    "climate",
+    "education",
+    "welfare",
+    "healthcare",
+    "infrastructure",
+    "transportation",
+    "energy",
+    "labor",
+    "employment",
+    "pension",
+    "retirement",
+    "crime",
+    "justice",
+    "court",
+    "judge",
+    "attorney",
+    "lobbyist",
+    "reform",
+    "referendum",
+    "constitution",
+    "bill",
+    "ordinance",
+    "executive",
+    "judicial",
+    "legislative",
+    "senator",
+    "congressman",
+    "governor",
+    "mayor",
+    "council",
+    "caucus",
+    "primary",
+    "ballot",
+    "protest",
+    "activism",
+    "campaign finance",
+    "super PAC",
+    "lawmaker",
+    "whistleblower",
+    "impeachment",
+    "scandal",
+    "gerrymandering",
+    "obama",
+    "clinton",
+    "sanders",
+    "warren",
+    "mcconnell",
+    "schumer",
+    "aoc",
+    "ocasio-cortez",
+    "harris",
+    "pence",
+    "cruz",
+    "rubio",
+    "graham",
+    "romney",
+    "mccarthy",
+    "boebert",
+    "greene",
+    "newsom",
+    "deblasio",
+    "cuomo",
+    "desantis",
+    "youngkin",
+    "whitmer",
+    "abbott",
+    "kemp",
+    "stacey abrams",
+    "yellen",
+    "powell",
+    "garland",
+    "fauci",
+    "gorsuch",
+    "kavanaugh",
+    "barrett",
+    "sotomayor",
+    "kagan",
+    "roberts",
+    "thomas",
+    "alito",
+    "bush",
+    "cheney",
+    "barr",
+    "sessions",
+    "mueller",
+    "comey",
+)
+
+
+@lru_cache(maxsize=1)
+def _build_parser():
     parser = ArgumentParser(description="Radio Observatory")
 
     # General directory structure
@@ -120,6 +263,12 @@ def get_args():
         help="wait time between consecutive retries in seconds (default: 60)",
     )
 
+    parser.add_argument(
+        "--transcode-audio",
+        action="store_true",
+        help="hand 16 kHz mono wav files to transcription instead of the raw stream (default: False)",
+    )
+
     # Transcription model arguments
     parser.add_argument(
         "--whisperx-model",
@@ -142,8 +291,8 @@ def get_args():
     parser.add_argument(
         "--whisperx-compute-type",
         type=str,
-        default="float16",
-        help="whisper model to use for transcription (default: float16)",
+        default=None,
+        help="compute type for the whisper model, e.g. float16, int8_float16, int8, float32 (default: float16 on cuda, int8 on cpu)",
     )
 
     parser.add_argument(
@@ -273,14 +422,14 @@ def get_args():
     parser.add_argument(
         "--start_date",
         type=str,
-        default=(datetime.today() - timedelta(1)).strftime("%m-%d-%Y"),
+        default=None,
         help="The start date for crawling (MM-DD-YYYY)",
     )
 
     parser.add_argument(
         "--end_date",
         type=str,
-        default=(datetime.today() - timedelta(1)).strftime("%m-%d-%Y"),
+        default=None,
         help="The end date for crawling (MM-DD-YYYY)",
     )
 
@@ -304,145 +453,7 @@ def get_args():
         "--political_keywords",
         type=str,
         nargs="*",
-        default=[
-            "politics",
-            "election",
-            "government",
-            "policy",
-            "politician",
-            "senate",
-            "congress",
-            "president",
-            "pelosi",
-            "campaign",
-            "vote",
-            "democracy",
-            "legislation",
-            "parliament",
-            "minister",
-            "diplomacy",
-            "administration",
-            "law",
-            "regulation",
-            "governance",
-            "political",
-            "party",
-            "national",
-            "immigration",
-            "health",
-            "biden",
-            "trump",
-            "presidential",
-            "debate",
-            "liberal",
-            "conservative",
-            "republican",
-            "democrat",
-            "socialism",
-            "capitalism",
-            "justice",
-            "equality",
-            "freedom",
-            "rights",
-            "liberty",
-            "economy",
-            "tax",
-            "budget",
-            "foreign",
-            "domestic",
-            "trade",
-            "war",
-            "peace",
-            "security",
-            "defense",
-            "environment",
-            "climate",
-            "education",
-            "welfare",
-            "healthcare",
-            "infrastructure",
-            "transportation",
-            "energy",
-            "labor",
-            "employment",
-            "pension",
-            "retirement",
-            "crime",
-            "justice",
-            "court",
-            "judge",
-            "attorney",
-            "lobbyist",
-            "reform",
-            "referendum",
-            "constitution",
-            "bill",
-            "ordinance",
-            "executive",
-            "judicial",
-            "legislative",
-            "senator",
-            "congressman",
-            "governor",
-            "mayor",
-            "council",
-            "caucus",
-            "primary",
-            "ballot",
-            "protest",
-            "activism",
-            "campaign finance",
-            "super PAC",
-            "lawmaker",
-            "whistleblower",
-            "impeachment",
-            "scandal",
-            "gerrymandering",
-            "obama",
-            "clinton",
-            "sanders",
-            "warren",
-            "mcconnell",
-            "schumer",
-            "aoc",
-            "ocasio-cortez",
-            "harris",
-            "pence",
-            "cruz",
-            "rubio",
-            "graham",
-            "romney",
-            "mccarthy",
-            "boebert",
-            "greene",
-            "newsom",
-            "deblasio",
-            "cuomo",
-            "desantis",
-            "youngkin",
-            "whitmer",
-            "abbott",
-            "kemp",
-            "stacey abrams",
-            "yellen",
-            "powell",
-            "garland",
-            "fauci",
-            "gorsuch",
-            "kavanaugh",
-            "barrett",
-            "sotomayor",
-            "kagan",
-            "roberts",
-            "thomas",
-            "alito",
-            "bush",
-            "cheney",
-            "barr",
-            "sessions",
-            "mueller",
-            "comey",
-        ],
+        default=_POLITICAL_KEYWORDS,
         help="List of political keywords to filter articles",
     )
 
@@ -465,6 +476,17 @@ def get_args():
         "--sentiment_end_date", type=str, default="", help="Keywords in title"
     )
 
-    args = parser.parse_args()
+    return parser
+
+
+def get_args():
+    args = _build_parser().parse_args()
+
+    # Date defaults are resolved per call because the parser is built only once
+    yesterday = (datetime.today() - timedelta(1)).strftime("%m-%d-%Y")
+    if args.start_date is None:
+        args.start_date = yesterday
+    if args.end_date is None:
+        args.end_date = yesterday
 
     return args
@@ -1,27 +1,139 @@
 """
 Stream audio from multiple radio stations concurrently, saving the recordings in 30-minute segments (configurable) for easier downstream processing.
-- Each recorded audio file is saved in a dedicated recordings folder for backup purposes. A temporary copy is placed in the audio_buffer folder for transcription.
+- Each audio file is recorded straight into an audio_buffer folder for transcription and hardlinked into a dedicated recordings folder for backup purposes once complete.
 - Temporary files in the audio_buffer folder are deleted automatically after transcription is completed.
 - If the application is running on multiple GPUs, a separate audio_buffer folder is created for each GPU. Audio files are distributed across these folders using load balancing to optimize transcription performance.
 """
 
 import config
+import contextlib
 import m3u8
 import os
+import random
 import requests
 import shutil
 import subprocess
+import threading
 import time
 
-from datetime import datetime
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
+from itertools import count
 from loguru import logger
-from multiprocessing import Pool
 from pathlib import Path
-from pydub import AudioSegment
+from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException
-from typing import List, Dict, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 from urllib.parse import urljoin
+from urllib3.util.retry import Retry
+
+# Shared HTTP session: keep-alive connections are reused across segments and stations,
+# and transient gateway errors are retried with backoff before reaching our retry loop
+http_session = requests.Session()
+http_adapter = HTTPAdapter(
+    pool_connections=64,
+    pool_maxsize=64,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504]),
+)
+http_session.mount("http://", http_adapter)
+http_session.mount("https://", http_adapter)
+
+# Background ffmpeg jobs; the work runs in subprocesses so threads are enough
+transcode_executor = ThreadPoolExecutor(max_workers=2)
+
+# Typical stream bitrate, used to reserve disk space for a segment before recording
+EXPECTED_BITRATE_BPS = 128_000
+
+# Round-robin position over the per-GPU buffer folders, shared by all recording threads
+buffer_counter = count()
+buffer_counter_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def open_preallocated(output_file: str, duration: float, buffering: int = -1):
+    """
+    Open output_file for writing with room for `duration` seconds of audio reserved
+    up front, so long recordings land in contiguous extents. The file is truncated to
+    the bytes actually written when closed.
+    """
+    with open(output_file, "wb", buffering=buffering) as f:
+        with contextlib.suppress(AttributeError, OSError):
+            os.posix_fallocate(
+                f.fileno(), 0, max(1, int(duration * EXPECTED_BITRATE_BPS) // 8)
+            )
+        try:
+            yield f
+        finally:
+            f.truncate()
+
+
+def fetch_segment(segment_url: str) -> bytes:
+    """
+    Download a single HLS media segment over a pooled keep-alive connection.
+    """
+    response = http_session.get(segment_url, timeout=10)
+    return response.content
+
+
+def record_hls_stream(url: str, output_file: str, end_time: float) -> bool:
+    """
+    Records an HLS (m3u8) live stream into output_file until end_time.
+
+    The playlist is re-fetched with a conditional GET, so an unchanged playlist costs
+    a 304 response and no parsing. Only segments whose media sequence number is newer
+    than the last one written are downloaded.
+
+    Returns:
+        bool: False if the playlist is empty or the application is shutting down.
+    """
+    etag = last_modified = None
+    target_duration = 5
+    last_media_sequence = -1
+
+    with ThreadPoolExecutor(max_workers=4) as prefetcher, open_preallocated(
+        output_file, end_time - time.time()
+    ) as f:
+        while time.time() < end_time:
+            headers = {}
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+            response = http_session.get(url, headers=headers, timeout=10)
+
+            if response.status_code != 304:
+                response.raise_for_status()
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
+
+                playlist = m3u8.loads(response.text, uri=url)
+                if not playlist.segments:
+                    logger.error("No segments found in the playlist")
+                    return False
+                target_duration = playlist.target_duration or 5
+
+                # Keep only segments newer than the last one written
+                first_sequence = playlist.media_sequence or 0
+                new_segment_urls = [
+                    urljoin(url, segment.uri)
+                    for sequence, segment in enumerate(
+                        playlist.segments, start=first_sequence
+                    )
+                    if sequence > last_media_sequence
+                ]
+                last_media_sequence = first_sequence + len(playlist.segments) - 1
+
+                # Download new segments concurrently, write them in playlist order
+                for content in prefetcher.map(fetch_segment, new_segment_urls):
+                    f.write(content)
+
+            # Wait for the playlist refresh interval, waking early on shutdown
+            if config.shutdown_event.wait(target_duration):
+                logger.info(f"stopped recording as application is shutting down")
+                return False
+
+    return True
 
 
 def record_segment(
@@ -50,48 +162,29 @@ def record_segment(
                 f"Attempting to record {url} to {output_file}, attempt {attempt + 1}"
             )
             if "m3u8" in url:
-                with open(output_file, "wb") as f:
-                    while time.time() < end_time:
-                        playlist = m3u8.load(url)
-                        if not playlist.segments:
-                            logger.error("No segments found in the playlist")
-                            return False
-
-                        # Process each segment
-                        for segment in playlist.segments:
-                            if time.time() >= end_time:
-                                break
-
-                            # Construct absolute URL for the segment
-                            segment_url = urljoin(url, segment.uri)
-                            # logger.info(f"Downloading segment: {segment_url}")
-
-                            # Download and write the segment
-                            response = requests.get(segment_url, timeout=10)
-                            f.write(response.content)
-
-                            # Wait for the playlist refresh interval
-                            time.sleep(playlist.target_duration or 5)
-
-                            if not config.shared_config["running"]:
-                                logger.info(
-                                    f"stopped recording as application is shutting down"
-                                )
-                                return False
+                if not record_hls_stream(url, output_file, end_time):
+                    return False
 
             else:
-                response = requests.get(url, stream=True, timeout=10)
-                with open(output_file, "wb") as f:
-                    start_time = time.time()
-                    while time.time() - start_time < segment_duration:
-                        chunk = response.iter_content(chunk_size=512)
-                        if chunk:
-                            f.write(next(chunk))
-                        if not config.shared_config["running"]:
+                response = http_session.get(url, stream=True, timeout=10)
+                # 64 KiB reads into a 1 MiB write buffer keep syscalls per second low
+                # Single iterator for the whole segment so no buffered bytes are dropped
+                chunks = response.iter_content(chunk_size=1 << 16)
+                deadline = time.monotonic() + segment_duration
+                with open_preallocated(
+                    output_file, segment_duration, buffering=1 << 20
+                ) as f:
+                    for chunk in chunks:
+                        if not chunk:
+                            continue
+                        f.write(chunk)
+                        if config.shutdown_event.is_set():
                             logger.info(
                                 f"stopped recording as application is shutting down"
                             )
                             return False
+                        if time.monotonic() >= deadline:
+                            break
                 logger.info(f"Successfully recorded {url} to {output_file}")
             return True
 
@@ -108,37 +201,219 @@ def record_segment(
             logger.info(f"stopping recording {url} to shut down app")
             return False
 
-        time.sleep(wait_time)
+        # Exponential backoff with jitter so stations recovering together don't retry in lockstep
+        backoff = min(wait_time * (2**attempt), 600) + random.uniform(0, wait_time * 0.5)
+        if config.shutdown_event.wait(backoff):
+            logger.info(f"stopping recording {url} to shut down app")
+            return False
 
     else:
         logger.error(f"Failed to record {url} after {retries} attempts")
         return False
 
 
+def count_entries(directory: str) -> int:
+    """
+    Count directory entries without building a list of their names.
+    """
+    with os.scandir(directory) as entries:
+        return sum(1 for _ in entries)
+
+
+def link_or_copy(source_file: str, target_file: str) -> None:
+    """
+    Make target_file refer to the same bytes as source_file as cheaply as possible:
+    a hardlink on the same filesystem, else an in-kernel copy, else a plain copy.
+    """
+    try:
+        os.link(source_file, target_file)
+        return
+    except OSError:
+        pass
+
+    try:
+        with open(source_file, "rb") as src, open(target_file, "wb") as dst:
+            remaining = os.fstat(src.fileno()).st_size
+            while remaining > 0:
+                copied = os.copy_file_range(src.fileno(), dst.fileno(), remaining)
+                if copied == 0:
+                    break
+                remaining -= copied
+        return
+    except (AttributeError, OSError):
+        pass
+
+    shutil.copy(source_file, target_file)
+
+
+def transcode_to_buffer(source_file: str, target_file: str, device_index: int) -> None:
+    """
+    Decode a recorded segment to the 16 kHz mono PCM WAV Whisper consumes, so the
+    transcription worker does not have to decode and resample it.
+    Falls back to handing over the raw recording if ffmpeg fails.
+    device_index is the GPU whose buffer folder target_file is in.
+    """
+    wav_file = f"{os.path.splitext(target_file)[0]}.wav"
+    # Write under a name the scribe listener ignores, then rename into place
+    partial_file = f"{wav_file}.part"
+    command = [
+        "ffmpeg",
+        "-nostdin",
+        "-loglevel",
+        "error",
+        "-y",
+        "-i",
+        source_file,
+        "-ac",
+        "1",
+        "-ar",
+        "16000",
+        "-c:a",
+        "pcm_s16le",
+        "-f",
+        "wav",
+        partial_file,
+    ]
+    try:
+        subprocess.run(command, check=True, capture_output=True)
+        os.replace(partial_file, wav_file)
+        config.audio_ready_events[device_index].set()
+        logger.info(f"Transcoded {source_file} to {wav_file}")
+    except (OSError, subprocess.CalledProcessError) as e:
+        logger.warning(f"ffmpeg transcode failed for {source_file}: {e}")
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(partial_file)
+        link_or_copy(source_file, target_file)
+        config.audio_ready_events[device_index].set()
+
+
+def choose_buffer_dir(audio_buffer_dir: str, no_of_devices: int) -> Tuple[str, int]:
+    """
+    Pick the per-GPU buffer folder the next segment should go to.
+
+    Returns:
+        The buffer folder and the index of the GPU it belongs to
+    """
+    # Load balancing buffer directory: prefer the GPU that clears files fastest
+    # relative to its backlog; GPUs without measurements yet count as the fastest
+    rates = {
+        device_index: rate
+        for device_index, rate in enumerate(config.gpu_rates[:no_of_devices])
+        if rate > 0
+    }
+    default_rate = max(rates.values(), default=1.0)
+
+    # Rotate the starting folder so ties are broken round-robin
+    with buffer_counter_lock:
+        start = next(buffer_counter) % no_of_devices
+    folders = [(start + i) % no_of_devices + 1 for i in range(no_of_devices)]
+    temp_folder = max(
+        folders,
+        key=lambda folder: rates.get(folder - 1, default_rate)
+        / (count_entries(f"{audio_buffer_dir}_{folder}") + 1),
+    )
+
+    return f"{audio_buffer_dir}_{temp_folder}", temp_folder - 1
+
+
 def copy_to_buffer(
-    audio_buffer_dir: str, file_name: str, output_file: str, no_of_devices: int
+    audio_buffer_dir: str,
+    file_name: str,
+    output_file: str,
+    no_of_devices: int,
+    transcode: bool = False,
 ) -> None:
-    # Load balancing buffer directory
-    temp_folder = 1
-    min_files = len(os.listdir(f"{audio_buffer_dir}_{1}"))
-    for i in range(2, no_of_devices + 1):
-        curr_files = len(os.listdir(f"{audio_buffer_dir}_{i}"))
-        if min_files > curr_files:
-            min_files = curr_files
-            temp_folder = i
-
-    curr_audio_buffer_dir = f"{audio_buffer_dir}_{temp_folder}"
+    curr_audio_buffer_dir, device_index = choose_buffer_dir(
+        audio_buffer_dir, no_of_devices
+    )
     temp_output_file = os.path.join(curr_audio_buffer_dir, file_name)
 
-    shutil.copy(output_file, temp_output_file)
+    if transcode:
+        # Transcode off the recording thread; the recording continues immediately
+        transcode_executor.submit(
+            transcode_to_buffer, output_file, temp_output_file, device_index
+        )
+        logger.info(f"Queued {file_name} for transcoding into {curr_audio_buffer_dir}")
+        return
+
+    # The transcriber removes the buffer entry only, the recording stays intact
+    link_or_copy(output_file, temp_output_file)
+    config.audio_ready_events[device_index].set()
     logger.info(
-        f"Successfully copied file {file_name} to temp folder: {curr_audio_buffer_dir}"
+        f"Successfully linked file {file_name} to temp folder: {curr_audio_buffer_dir}"
     )
     return
 
 
+def record_to_buffer(
+    url: str,
+    file_name: str,
+    audio_path: Path,
+    audio_buffer_dir: str,
+    no_of_devices: int,
+    duration: int,
+    retries: int,
+    wait_time: int,
+    transcode: bool = False,
+) -> Optional[str]:
+    """
+    Records one segment and hands it to a transcription buffer folder.
+
+    Without transcoding the segment is written to the "<audio_buffer_dir>_staging"
+    folder, next to the buffer folders, so it is not counted as backlog while it is
+    recorded. Once complete it is hardlinked into the recordings folder, and only then
+    is a buffer folder chosen and the segment renamed into it, so transcription starts
+    without waiting on a copy. With transcoding the recording is written to the
+    recordings folder and queued for ffmpeg as before.
+
+    Returns:
+        The recordings path of the segment if successful else None
+    """
+    output_file = str(audio_path / file_name)
+
+    if transcode:
+        if not record_segment(url, output_file, duration, retries, wait_time):
+            return None
+        copy_to_buffer(audio_buffer_dir, file_name, output_file, no_of_devices, True)
+        return output_file
+
+    partial_file = os.path.join(f"{audio_buffer_dir}_staging", f"{file_name}.part")
+
+    if not record_segment(url, partial_file, duration, retries, wait_time):
+        # Keep whatever was recorded as a backup, but never hand it to transcription
+        if os.path.exists(partial_file):
+            shutil.move(partial_file, output_file)
+        return None
+
+    # Link the backup first: the transcriber deletes the buffer entry once it is done
+    link_or_copy(partial_file, output_file)
+    # Balance on the GPU rates and backlogs as they are now, not as they were when the
+    # recording started
+    curr_audio_buffer_dir, device_index = choose_buffer_dir(
+        audio_buffer_dir, no_of_devices
+    )
+    os.replace(partial_file, os.path.join(curr_audio_buffer_dir, file_name))
+    config.audio_ready_events[device_index].set()
+    logger.info(f"Recorded {file_name} into temp folder: {curr_audio_buffer_dir}")
+    return output_file
+
+
+def _segment_durations(total_duration: int, segment_duration: int) -> Iterator[int]:
+    """
+    Yield the length of each segment: full segments, then the remainder if any.
+    """
+    num_segments, remaining_duration = divmod(total_duration, segment_duration)
+    yield from [segment_duration] * num_segments
+    if remaining_duration:
+        yield remaining_duration
+
+
 def record_live_stream(
-    station_info: Dict[str, str], retries: int, wait_time: int, no_of_devices: int
+    station_info: Dict[str, str],
+    retries: int,
+    wait_time: int,
+    no_of_devices: int,
+    transcode: bool = False,
 ) -> Optional[str]:
     """
     Records a live stream from a given URL and saves it as multiple MP3 files in 5-minute batches.
@@ -185,69 +460,82 @@ def record_live_stream(
         )
     )
 
-    # Calculate the number of 30-minute segments
-    num_segments = total_duration // segment_duration
-    remaining_duration = total_duration % segment_duration
-
-    for segment in range(num_segments):
-        current_time = datetime.now()
-        string_datetime = current_time.strftime("%Y_%m_%d_%H_%M")
-        file_name = f"{radio_name}_{string_datetime}.mp3"
-
-        output_file = os.path.join(audio_dir, file_name)
-
-        if not record_segment(url, output_file, segment_duration, retries, wait_time):
-            return None  # Return None if segment recording failed
-
-        copy_to_buffer(audio_buffer_dir, file_name, output_file, no_of_devices)
-
-        # Sleep until the next 5-minute segment starts
-        time_to_sleep = segment_duration - (time.time() - current_time.timestamp())
-        if time_to_sleep > 0:
-            time.sleep(time_to_sleep)
+    audio_path = Path(audio_dir)
 
-    # Handle the last segment if remaining duration is not zero
-    if remaining_duration > 0:
-        current_time = datetime.now()
-        string_datetime = current_time.strftime("%Y_%m_%d_%H_%M")
+    # 30-minute segments followed by a shorter tail for any remaining duration
+    output_file = None
+    for duration in _segment_durations(total_duration, segment_duration):
+        segment_start = time.time()
+        string_datetime = time.strftime(
+            "%Y_%m_%d_%H_%M", time.localtime(segment_start)
+        )
         file_name = f"{radio_name}_{string_datetime}.mp3"
 
-        output_file = os.path.join(audio_dir, file_name)
-
-        if not record_segment(url, output_file, remaining_duration, retries, wait_time):
+        output_file = record_to_buffer(
+            url,
+            file_name,
+            audio_path,
+            audio_buffer_dir,
+            no_of_devices,
+            duration,
+            retries,
+            wait_time,
+            transcode,
+        )
+        if output_file is None:
             return None  # Return None if segment recording failed
 
-        # Copy the recorded file to temp_output_file to be transcribed
-        copy_to_buffer(audio_buffer_dir, file_name, output_file, no_of_devices)
+        # Sleep until the next 5-minute segment starts, waking early on shutdown
+        time_to_sleep = duration - (time.time() - segment_start)
+        if time_to_sleep > 0 and config.shutdown_event.wait(time_to_sleep):
+            logger.info(f"stopping recording {radio_name} to shut down app")
+            return None
 
     logger.info(f"Exiting record_live_stream, last file: {output_file}")
     return output_file
 
 
+def pack_station_streams(
+    station_stream_list: List[Dict],
+) -> Tuple[Tuple[str, ...], Tuple[str, ...], array]:
+    """
+    Store a list of stations column-wise as (urls, radio_names, durations), the form
+    stream_parallel takes. Scheduled jobs then carry three flat columns instead of one
+    dict per station.
+    """
+    return (
+        tuple(station["url"] for station in station_stream_list),
+        tuple(station["radio_name"] for station in station_stream_list),
+        array("i", (station["duration"] for station in station_stream_list)),
+    )
+
+
 def stream_parallel(
-    station_stream_list: List[Dict[str, str]],
+    station_streams: Tuple[Tuple[str, ...], Tuple[str, ...], array],
     segment_duration: int = 1800,
     audio_dir: str = "assets/data/audio",
     audio_buffer_dir: str = "assets/data/audio_buffer",
     no_of_devices: int = 1,
     retries: int = 5,
     wait_time: int = 60,
+    transcode: bool = False,
 ) -> None:
     """
     Records multiple live streams in parallel onto disk.
     Sets name of output file based on station name and current date.
 
     Parameters:
-        station_stream_list (list of dict): A list of dictionaries, each containing:
-            - 'url' (str): The URL of the live stream.
-            - 'radio_name' (str): The name of the radio station.
-            - 'duration' (int): duration for which to record stream (in seconds)
+        station_streams (tuple): Stations to record, column-wise (see pack_station_streams):
+            - urls (tuple of str): The URLs of the live streams.
+            - radio_names (tuple of str): The names of the radio stations.
+            - durations (array of int): duration for which to record each stream (in seconds)
         segment_duration (int): record audio in segments of this duration (in seconds)
         audio_dir (str): Directory at which streamed audio files will be stored.
         audio_buffer_dir (str): Directory at which copied audio files pending transcription will be stored
         no_of_devices (int): number of gpus being used for transcription
         retries (int): number of retries to try to record audio
         wait_time (int): wait time between consecutive retry attempts (in seconds)
+        transcode (bool): hand 16 kHz mono wav files to transcription instead of the raw stream
 
     Returns:
      None
@@ -257,7 +545,7 @@ def stream_parallel(
                 {'url': 'http://example.com/stream', 'radio_name': 'ST_EXMP', 'duration':1800},
                 {'url': 'http://test.com/stream', 'radio_name': 'ST_TEST', 'duration':3000}
                 }
-        >> stream_parallel(station_stream_list, 1800, "assets/data")
+        >> stream_parallel(pack_station_streams(station_stream_list), 1800, "assets/data")
         following files will be created :
         [
             "assets/data/audio/ST_EXMP_2024_01_01_08_00.wav",
@@ -276,14 +564,14 @@ def stream_parallel(
 
     station_info_list = []
 
-    # Iterate through station_stream_list to create station_info_list and output_files
-    for station in station_stream_list:
+    # Iterate through the station columns to create station_info_list and output_files
+    for url, radio_name, duration in zip(*station_streams):
         station_info = {
-            "url": station["url"],
-            "radio_name": station["radio_name"],
+            "url": url,
+            "radio_name": radio_name,
             "audio_dir": audio_dir,
             "audio_buffer_dir": audio_buffer_dir,
-            "duration": station["duration"],
+            "duration": duration,
             "segment_duration": segment_duration,
         }
         station_info_list.append(station_info)
@@ -295,10 +583,13 @@ def stream_parallel(
         retries=retries,
         wait_time=wait_time,
         no_of_devices=no_of_devices,
+        transcode=transcode,
     )
-    # Use multiprocessing Pool to run record_live_stream function in parallel
-    with Pool(processes=len(station_info_list)) as pool:
-        result_files = pool.map(record_live_stream_with_args, station_info_list)
+    # Recording is network and disk bound, so one thread per station is enough
+    with ThreadPoolExecutor(max_workers=len(station_info_list)) as executor:
+        result_files = list(
+            executor.map(record_live_stream_with_args, station_info_list)
+        )
 
     output_files = tuple(file for file in result_files if file is not None)
     logger.debug(output_files)
@@ -334,7 +625,11 @@ if __name__ == "__main__":
     start_time = time.time()
     segment_duration = 1800  # args.segment_duration
     stream_parallel(
-        station_stream_list, segment_duration, data_dir, retries=5, wait_time=60
+        pack_station_streams(station_stream_list),
+        segment_duration,
+        data_dir,
+        retries=5,
+        wait_time=60,
     )
     end_time = time.time()
     logger.info(f"total time: {end_time - start_time}")
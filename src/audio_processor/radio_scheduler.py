@@ -4,20 +4,46 @@ For streams where the scheduled start time has already passed but the end time i
 Cron trigger calls the following function to stream audio from multiple radio stations in parallel : audio_processor.audio_streamer:stream_parallel
 """
 
-import json
+import orjson
 import os
-import time
 
+from collections import defaultdict
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.schedulers.base import BaseScheduler
+from apscheduler.schedulers.blocking import BlockingScheduler
 from apscheduler.triggers.cron import CronTrigger
 from args import get_args
-from audio_processor.audio_streamer import stream_parallel
+from audio_processor.audio_streamer import pack_station_streams, stream_parallel
 from datetime import datetime, timedelta
+from functools import lru_cache
 from pytz import timezone
 from loguru import logger
 from typing import List, Dict
 
 
+MINUTES_PER_DAY = 24 * 60
+
+EASTERN = timezone("US/Eastern")
+
+
+@lru_cache(maxsize=2048)
+def _hhmm_to_min(time_str: str) -> int:
+    """
+    Convert a time given in the format "HH:MM" to minutes since midnight.
+    """
+    hour, minute = time_str.split(":")
+    return int(hour) * 60 + int(minute)
+
+
+@lru_cache(maxsize=256)
+def cron_trigger(hour: int, minute: int) -> CronTrigger:
+    """
+    Daily US/Eastern trigger at hour:minute. Triggers keep no per-job state, so jobs
+    starting at the same time share one instance.
+    """
+    return CronTrigger(hour=hour, minute=minute, timezone=EASTERN)
+
+
 def get_duration(start_time: str, end_time: str) -> int:
     """
     Calculate the duration in seconds between two times given in the format "HH:MM".
@@ -29,16 +55,9 @@ def get_duration(start_time: str, end_time: str) -> int:
     Returns:
         int: The duration in seconds between the start and end times.
     """
-    time_format = "%H:%M"
-    start = datetime.strptime(start_time, time_format)
-    end = datetime.strptime(end_time, time_format)
-
-    # Handle cases where end time is past midnight (i.e., next day)
-    if end < start:
-        end += timedelta(days=1)
-
-    duration = end - start
-    return int(duration.total_seconds())
+    # The modulo handles cases where end time is past midnight (i.e., next day)
+    duration = (_hhmm_to_min(end_time) - _hhmm_to_min(start_time)) % MINUTES_PER_DAY
+    return duration * 60
 
 
 # def handle_already_started(station_stream_info):
@@ -55,27 +74,24 @@ def handle_already_started(station_stream_info: List[Dict]) -> List[Dict]:
         list: The updated station stream information with adjusted start times.
     """
     now = datetime.now()
-    time_format = "%H:%M"
+    # Seconds since midnight, schedule times are compared in whole minutes
+    now_seconds = now.hour * 3600 + now.minute * 60 + now.second + now.microsecond / 1e6
     for station in station_stream_info:
-        for i in range(len(station["time"])):
-            start_time, end_time = station["time"][i]
-            start = datetime.strptime(start_time, time_format)
-            start = start.replace(year=now.year, month=now.month, day=now.day)
-            end = datetime.strptime(end_time, time_format)
-            end = end.replace(year=now.year, month=now.month, day=now.day)
-
-            if end < start:
-                try:
-                    end = end.replace(year=now.year, month=now.month, day=now.day + 1)
-                except ValueError:
-                    logger.warning("Rounding up to next month")
-                    end = end.replace(year=now.year, month=now.month + 1, day=1)
+        for time_slot in station["time"]:
+            start_minutes = _hhmm_to_min(time_slot[0])
+            # Most slots have not started yet and need no further work
+            if start_minutes * 60 >= now_seconds:
+                continue
+
+            end_minutes = _hhmm_to_min(time_slot[1])
+            # Handle cases where end time is past midnight (i.e., next day)
+            if end_minutes < start_minutes:
+                end_minutes += MINUTES_PER_DAY
 
             # Adjust start time if it has already passed but end time is not within 2 minutes from now
-            if start < now and end > now + timedelta(minutes=2):
+            if now_seconds < end_minutes * 60 - 120:
                 start = now + timedelta(minutes=2)
-                new_start_time = start.strftime(time_format)
-                station["time"][i][0] = new_start_time
+                time_slot[0] = start.strftime("%H:%M")
     return station_stream_info
 
 
@@ -130,47 +146,45 @@ def process_schedule_file(radio_schedule_file: str, data_dir: str) -> list[dict]
             }
         ]
     """
-    with open(radio_schedule_file) as f:
-        station_stream_info = json.load(f)
+    with open(radio_schedule_file, "rb") as f:
+        station_stream_info = orjson.loads(f.read())
 
     # Handle the cases where start time has already passed but end time has not
     # set their start_time to 2 minutes ahead of current time
     station_stream_info = handle_already_started(station_stream_info)
 
-    # Initialize an empty dictionary to store station schedule info
-    station_schedule_info = []
-
-    # Create list (sorting based on start time) to keep track of unique times
-    unique_times = []
+    # Group stations by start time in a single pass over the schedule
+    stations_by_time = defaultdict(list)
     for station in station_stream_info:
-        for start_time, _ in station["time"]:
-            if start_time not in unique_times:
-                unique_times.append(start_time)
+        radio_name = f"{station['state']}_{station['radio_name']}"
+        for start_time, end_time in station["time"]:
+            stations_by_time[start_time].append(
+                {
+                    "url": station["url"],
+                    "radio_name": radio_name,
+                    "duration": get_duration(start_time, end_time),
+                }
+            )
 
-    unique_times.sort()
+    unique_times = sorted(stations_by_time)
     logger.info(f"unique timings: {unique_times}")
 
-    # Iterate over unique timings and group stations accordingly
-    for time_slot in unique_times:
-        stations_at_time = []
-        for station in station_stream_info:
-            for start_time, end_time in station["time"]:
-                if start_time == time_slot:
-                    stations_at_time.append(
-                        {
-                            "url": station["url"],
-                            "radio_name": f"{station['state']}_{station['radio_name']}",
-                            "duration": get_duration(start_time, end_time),
-                        }
-                    )
-        station_schedule_info.append(
-            {"time": time_slot, "radio_list": stations_at_time}
-        )
-
-    # Write station_schedule_info into a file for easy cross verification of schedules
+    # Station schedule info sorted based on start time
+    station_schedule_info = [
+        {"time": time_slot, "radio_list": stations_by_time[time_slot]}
+        for time_slot in unique_times
+    ]
+
+    # Write station_schedule_info into a file for easy cross verification of schedules,
+    # one slot at a time so the whole document is never serialized in memory at once
     processed_schedule = os.path.join(data_dir, "processed_schedule.json")
-    with open(processed_schedule, "w") as json_file:
-        json.dump(station_schedule_info, json_file, indent=4)
+    with open(processed_schedule, "wb") as json_file:
+        json_file.write(b"[\n")
+        for index, time_slot in enumerate(station_schedule_info):
+            if index:
+                json_file.write(b",\n")
+            json_file.write(orjson.dumps(time_slot, option=orjson.OPT_INDENT_2))
+        json_file.write(b"\n]\n")
 
     return station_schedule_info
 
@@ -181,13 +195,15 @@ def create_scheduler(
     audio_dir: str,
     audio_buffer_dir: str,
     no_of_devices: int,
-) -> BackgroundScheduler:
+    transcode: bool = False,
+    blocking: bool = False,
+) -> BaseScheduler:
     """
     Creates a background scheduler that records audio streams using
         audio_streamer.py based on schedule from station_schedule_info.
     It is triggered using a CronTrigger and
         calls "audio_processor.audio_streamer:stream_parallel" method
-    It passes (time_slot["radio_list"], segment_duration, audio_dir, audio_buffer_dir) as arguments.
+    It passes (time_slot["radio_list"] packed column-wise, segment_duration, audio_dir, audio_buffer_dir) as arguments.
     After creating and starting scheduler main process runs in infinite loop till keyboard interrupt.
 
     Parameters:
@@ -201,6 +217,9 @@ def create_scheduler(
         segment_duration (int): record audio in segments of this duration (in seconds)
         audio_dir (str): Directory at which audio files are stored
         audio_buffer_dir (str): path to temp audio file directory that need to be transcribed
+        no_of_devices (int): number of gpus being used for transcription
+        transcode (bool): hand 16 kHz mono wav files to transcription instead of the raw stream
+        blocking (bool): create a scheduler whose start() runs it in the calling thread
 
     Example:
     >> station_schedule_info
@@ -219,7 +238,7 @@ def create_scheduler(
     >> create_scheduler(station_schedule_info, segment_duration, audio_dir, audio_buffer_dir)
 
     creates a schedule to call method
-    src.audio_processor.audio_streamer.stream_parallel(time_slot["radio_list"], segment_duration, audio_dir, audio_buffer_dir)
+    src.audio_processor.audio_streamer.stream_parallel(pack_station_streams(time_slot["radio_list"]), segment_duration, audio_dir, audio_buffer_dir)
     where time_slot["radio_list"] = [
                 {
                     "url": "https://stream.revma.ihrhls.com/zc3014",
@@ -230,24 +249,37 @@ def create_scheduler(
     """
 
     # Initialize scheduler
-    scheduler = BackgroundScheduler()
-    scheduler.configure(timezone=timezone("US/Eastern"))
+    # A recording that fires late is still worth starting, but never twice at once
+    scheduler_class = BlockingScheduler if blocking else BackgroundScheduler
+    scheduler = scheduler_class(
+        job_defaults={"coalesce": True, "max_instances": 1, "misfire_grace_time": 300},
+        # Recording jobs block for their whole duration, so leave room for overlapping
+        # slots times one job per GPU instead of APScheduler's default of 10 threads
+        executors={"default": {"type": "threadpool", "max_workers": 64}},
+    )
+    scheduler.configure(timezone=EASTERN)
 
-    # Create trigger/schedules for each time slot
+    # Create trigger/schedules for each time slot, with the slot's stations split into
+    # one job per GPU so a shard's recordings run and fail independently of the others.
+    # Jobs added before start() are queued and the job store is filled in one batch
     for time_slot in station_schedule_info:
-        hour, min = time_slot["time"].split(":")
-        trigger = CronTrigger(hour=hour, minute=min)
-        scheduler.add_job(
-            "audio_processor.audio_streamer:stream_parallel",
-            trigger=trigger,
-            args=[
-                time_slot["radio_list"],
-                segment_duration,
-                audio_dir,
-                audio_buffer_dir,
-                no_of_devices,
-            ],
-        )
+        hh, mm = time_slot["time"].split(":")
+        trigger = cron_trigger(int(hh), int(mm))
+        radio_list = time_slot["radio_list"]
+        for shard_index in range(min(no_of_devices, len(radio_list))):
+            scheduler.add_job(
+                "audio_processor.audio_streamer:stream_parallel",
+                trigger=trigger,
+                args=[
+                    pack_station_streams(radio_list[shard_index::no_of_devices]),
+                    segment_duration,
+                    audio_dir,
+                    audio_buffer_dir,
+                    no_of_devices,
+                ],
+                kwargs={"transcode": transcode},
+                id=f"{time_slot['time']}_{shard_index}",
+            )
 
     return scheduler
 
@@ -259,7 +291,9 @@ def create_radio_streaming_scheduler(
     radio_schedule_file: str,
     segment_duration: int,
     no_of_devices: int,
-) -> BackgroundScheduler:
+    transcode: bool = False,
+    blocking: bool = False,
+) -> BaseScheduler:
     """
     Process radio schedules from schedule.json file in assets directory.
     Create and return background scheduler for recording audio streams.
@@ -270,6 +304,8 @@ def create_radio_streaming_scheduler(
         radio_schedule_file (str): json file with schedule for streaming radio stations
         segment_duration (int): streamed audio to be recorded in segments of this duration
         no_of_devices (int): number of gpus being used for transcription
+        transcode (bool): hand 16 kHz mono wav files to transcription instead of the raw stream
+        blocking (bool): create a scheduler whose start() runs it in the calling thread
     """
     station_schedule_info = process_schedule_file(radio_schedule_file, data_dir)
 
@@ -279,6 +315,8 @@ def create_radio_streaming_scheduler(
         audio_dir,
         audio_buffer_dir,
         no_of_devices,
+        transcode,
+        blocking,
     )
 
 
@@ -294,21 +332,27 @@ if __name__ == "__main__":
     radio_schedule_file = os.path.join(args.assets_dir, args.radio_schedule)
     os.makedirs(data_dir, exist_ok=True)
     os.makedirs(audio_dir, exist_ok=True)
-    os.makedirs(audio_buffer_dir, exist_ok=True)
+    # Single transcription buffer when the scheduler runs on its own
+    os.makedirs(f"{audio_buffer_dir}_1", exist_ok=True)
+    os.makedirs(f"{audio_buffer_dir}_staging", exist_ok=True)
     logger.info(f"all the required directories for audio streaming created/exist")
     segment_duration = args.segment_duration
 
     scheduler = create_radio_streaming_scheduler(
-        data_dir, audio_dir, audio_buffer_dir, radio_schedule_file, segment_duration
+        data_dir,
+        audio_dir,
+        audio_buffer_dir,
+        radio_schedule_file,
+        segment_duration,
+        no_of_devices=1,
+        transcode=args.transcode_audio,
+        blocking=True,
     )
 
     logger.info(f"starting radio scheduler .....")
-    scheduler.start()
     try:
-        # This is here to keep the main thread alive
-        while True:
-            logger.info(f"sleeping for 30 seconds zzz.......")
-            time.sleep(30)
+        # Runs the scheduler in the main thread until interrupted
+        scheduler.start()
 
     except (KeyboardInterrupt, SystemExit):
         scheduler.remove_all_jobs()
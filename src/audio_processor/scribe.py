@@ -7,50 +7,78 @@ Transcribe the audio file in audio buffer folder and save it in json format. Sav
 import config
 import contextlib
 import gc
-import json
+import numpy as np
+import orjson
 import os
+import threading
 import time
 import torch
 import whisperx
 
 from args import get_args
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from loguru import logger
-from typing import Tuple, Dict
+from typing import Dict, Iterator, List, Optional, Tuple
 from utils.timezone_converter import convert_timezone
+from whisperx.audio import SAMPLE_RATE
 
+# Silence between files transcribed together, at least WhisperX's 30 s chunk size
+BATCH_GAP_SECONDS = 30
 
-def transcribe_audio(
-    audio_files: Tuple[str],
-    model_parameters: Dict[str, str],
-    models_dir: str = "assets/models",
-    transcripts_dir: str = "assets/data/transcripts",
-) -> int:
+# Upper bound on decoded audio held in memory for one batched transcription call
+MAX_BATCH_SECONDS = 2 * 60 * 60
+
+# Transcripts are written off the GPU loop so the next batch starts right away
+transcript_writer = ThreadPoolExecutor(max_workers=2)
+
+
+def update_gpu_rate(device_index: int, elapsed: float) -> None:
     """
-    Transcribe audio files using WhisperX and save them.
+    Fold the time taken for one file into the GPU's moving-average throughput.
+    """
+    if device_index >= len(config.gpu_rates):
+        return
+    rate = 1 / max(elapsed, 1e-6)
+    previous = config.gpu_rates[device_index]
+    config.gpu_rates[device_index] = (
+        rate if previous == 0 else 0.9 * previous + 0.1 * rate
+    )
+
+
+def resolve_compute_type(device: str, compute_type: Optional[str]) -> str:
+    """
+    Use reduced precision unless a compute type was asked for explicitly: float16 on
+    GPU, int8 on CPU where CTranslate2 has no float16 kernels.
+    """
+    if compute_type is None:
+        return "float16" if device == "cuda" else "int8"
+    if device == "cpu" and compute_type == "float16":
+        logger.warning("float16 is not supported on cpu, using int8 instead")
+        return "int8"
+    return compute_type
+
+
+def load_models(
+    model_parameters: Dict[str, str], models_dir: str = "assets/models"
+) -> Dict:
+    """
+    Load the WhisperX model (plus alignment and diarization models when diarization is
+    on) once, so a listener can keep them on its GPU across batches.
 
     Parameters:
-        - audio_files (tuple): A tuple of audio file names that need to be transcribed.
         - model_parameters (dict): [
             - 'device' (str): device to load WhisperX model (cpu or cuda)
             - 'device_index' (int): index of gpu on which to load WhisperX model
             - 'batch_size' (int): WhisperX batch size
-            - 'compute_type' (str): WhisperX compute type ex. float16, float32
+            - 'compute_type' (str): WhisperX compute type ex. float16, float32 (None: float16 on cuda, int8 on cpu)
             - 'whisper_model' (str): Whisper model to use ex. small, medium, large-v3 etc
         ]
         - models_dir (str): Directory at which WhisperX model will be downloaded.
-        - transcripts_dir (str): Path to directory that stores transcripts
     Returns:
-        int: Number of files transcribed in current batch
-    Example:
-        >>> audio_files = [audio_1.mp3, audio_2.mp3]
-        >>> transcribe_audio(audio_files, model_parameters)
-
-        Generate and save files : audio_1_transcript.json and audio_2_transcript.json
+        dict: Loaded models and the settings transcribe_audio needs to run them
     """
-
-    logger.info(f"transcribing for {len(audio_files)} audio files")
-
     args = get_args()
     diarize = args.diarize
     hf_token = args.hf_token
@@ -58,8 +86,7 @@ def transcribe_audio(
     # Setup model parameters and load model
     device = model_parameters["device"]
     device_index = model_parameters["device_index"]
-    batch_size = model_parameters["batch_size"]
-    compute_type = model_parameters["compute_type"]
+    compute_type = resolve_compute_type(device, model_parameters["compute_type"])
     whisper_model = model_parameters["whisper_model"]
 
     asr_options = {
@@ -70,87 +97,277 @@ def transcribe_audio(
 
     logger.debug(f"Loading model with device index: {device_index}")
 
-    model = whisperx.load_model(
-        whisper_model,
-        device,
-        device_index,
-        compute_type=compute_type,
-        language="en",
-        download_root=models_dir,
-        asr_options=asr_options,
-    )
+    models = {
+        "model": whisperx.load_model(
+            whisper_model,
+            device,
+            device_index,
+            compute_type=compute_type,
+            language="en",
+            download_root=models_dir,
+            asr_options=asr_options,
+        ),
+        "device_index": device_index,
+        "batch_size": model_parameters["batch_size"],
+        "diarize": diarize,
+    }
 
     if diarize:
         torch_device = f"{device}:{device_index}"
         model_a, metadata = whisperx.load_align_model("en", device=torch_device)
-        diarize_model = whisperx.DiarizationPipeline(
+        models["torch_device"] = torch_device
+        models["model_a"] = model_a
+        models["metadata"] = metadata
+        models["diarize_model"] = whisperx.DiarizationPipeline(
             use_auth_token=hf_token, device=torch_device
         )
 
     logger.info("Loaded models")
+    return models
 
-    number_of_files_transcribed = 0
 
+def release_models(models: Dict) -> None:
+    """
+    Drop the models loaded by load_models and return their GPU memory.
+    """
+    models.clear()
+    gc.collect()
+    torch.cuda.empty_cache()
+
+
+def write_transcript(output_json_file: str, segments: List[Dict]) -> None:
+    """
+    Save transcript segments as JSON. Transcripts are only read by code, so they are
+    written without indentation.
+    """
+    with open(output_json_file, "wb") as json_file:
+        json_file.write(orjson.dumps(segments, option=orjson.OPT_SERIALIZE_NUMPY))
+
+
+def should_stop(stop_event: Optional[threading.Event] = None) -> bool:
+    """
+    True once the application is shutting down or this worker was asked to stop.
+    """
+    return not config.is_running() or (stop_event is not None and stop_event.is_set())
+
+
+def load_audio_batches(
+    audio_files: Tuple[str],
+    stop_event: Optional[threading.Event] = None,
+) -> Iterator[List[Tuple[str, np.ndarray]]]:
+    """
+    Decode audio files and group them into batches of at most MAX_BATCH_SECONDS of
+    audio. Files that fail to decode are logged and removed from the buffer.
+    """
+    batch = []
+    batch_samples = 0
     for audio_file in audio_files:
-        if not config.shared_config["running"]:
+        if should_stop(stop_event):
             break
         try:
             # Load audio file
             audio = whisperx.load_audio(audio_file)
-            logger.info(f"starting transcription for {audio_file} ....")
-            start_time = time.time()
-            # 1. Transcribe audio
-            result = model.transcribe(audio, batch_size=batch_size, language="en")
-            if diarize:
-                # 2. Align whisper output
-                result = whisperx.align(
-                    result["segments"],
-                    model_a,
-                    metadata,
-                    audio,
-                    torch_device,
-                    return_char_alignments=False,
-                )
-                # 3. Assign speaker labels
-                diarize_segments = diarize_model(audio)
-                result = whisperx.assign_word_speakers(diarize_segments, result)
-                for segment in result["segments"]:
-                    del segment["words"]
-
-            end_time = time.time()
-            logger.info(f"Transcription completed in: {(end_time - start_time):.2f}s")
-
-            # Save result to a JSON file
-            audio_file_name = os.path.basename(audio_file)
-            output_json_file = os.path.join(
-                transcripts_dir, "unclassified_buffer", f"{audio_file_name[:-4]}.json"
-            )
+        except Exception as e:
+            logger.error(f"Error loading {audio_file}: {e}", exc_info=True)
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(audio_file)
+            continue
+
+        if batch and batch_samples + len(audio) > MAX_BATCH_SECONDS * SAMPLE_RATE:
+            yield batch
+            batch = []
+            batch_samples = 0
+        batch.append((audio_file, audio))
+        batch_samples += len(audio)
 
-            with open(output_json_file, "w") as json_file:
-                json.dump(result["segments"], json_file, indent=4)
+    if batch:
+        yield batch
 
-            # output_txt_file = os.path.join(transcripts_dir,
-            #                            f"{audio_file_name[:-4]}.txt")
-            # reformat_and_save(audio_file_name, output_txt_file, result, diarize)
 
-            number_of_files_transcribed += 1
-            del audio
-            gc.collect()
-            torch.cuda.empty_cache()
+def transcribe_batch(
+    model, audios: List[np.ndarray], batch_size: int
+) -> List[List[Dict]]:
+    """
+    Transcribe several decoded files with a single WhisperX call, so short files share
+    GPU batches instead of each running its own partly filled ones.
+
+    The files are joined with BATCH_GAP_SECONDS of silence in between. WhisperX only
+    merges speech into one chunk while it spans less than 30 seconds, so no segment
+    crosses from one file into the next. Segments are then split back per file with
+    their timestamps made relative to the start of that file.
+    """
+    gap = np.zeros(BATCH_GAP_SECONDS * SAMPLE_RATE, dtype=np.float32)
+    offsets = []
+    pieces = []
+    position = 0
+    for audio in audios:
+        offsets.append(position / SAMPLE_RATE)
+        pieces += [audio, gap]
+        position += len(audio) + len(gap)
+
+    result = model.transcribe(
+        np.concatenate(pieces), batch_size=batch_size, language="en"
+    )
+
+    batch_segments = [[] for _ in audios]
+    for segment in result["segments"]:
+        index = bisect_right(offsets, segment["start"]) - 1
+        offset = offsets[index]
+        batch_segments[index].append(
+            {
+                **segment,
+                "start": round(segment["start"] - offset, 3),
+                "end": round(segment["end"] - offset, 3),
+            }
+        )
+    return batch_segments
+
+
+def transcribe_file(
+    model, audio_file: str, audio: np.ndarray, batch_size: int
+) -> Optional[List[Dict]]:
+    """
+    Transcribe one decoded file on its own, used when the batch it was in failed so a
+    single bad file does not cost the whole batch. Returns None if it fails again.
+    """
+    try:
+        return model.transcribe(audio, batch_size=batch_size, language="en")["segments"]
+    except Exception as e:
+        logger.error(f"Error transcribing {audio_file}: {e}", exc_info=True)
+        return None
+
+
+def transcribe_audio(
+    audio_files: Tuple[str],
+    models: Dict,
+    transcripts_dir: str = "assets/data/transcripts",
+    stop_event: Optional[threading.Event] = None,
+) -> int:
+    """
+    Transcribe audio files using WhisperX and save them.
+
+    Parameters:
+        - audio_files (tuple): A tuple of audio file names that need to be transcribed.
+        - models (dict): Models and settings returned by load_models
+        - transcripts_dir (str): Path to directory that stores transcripts
+        - stop_event (threading.Event): Set to stop at the next file boundary, files
+            not reached yet stay in the buffer
+    Returns:
+        int: Number of files transcribed in current batch
+    Example:
+        >>> audio_files = [audio_1.mp3, audio_2.mp3]
+        >>> models = load_models(model_parameters, models_dir)
+        >>> transcribe_audio(audio_files, models)
 
+        Generate and save files : audio_1_transcript.json and audio_2_transcript.json
+    """
+
+    logger.info(f"transcribing for {len(audio_files)} audio files")
+
+    model = models["model"]
+    device_index = models["device_index"]
+    batch_size = models["batch_size"]
+    diarize = models["diarize"]
+    if diarize:
+        torch_device = models["torch_device"]
+        model_a = models["model_a"]
+        metadata = models["metadata"]
+        diarize_model = models["diarize_model"]
+
+    number_of_files_transcribed = 0
+    pending_writes = []
+
+    for batch in load_audio_batches(audio_files, stop_event):
+        logger.info(f"starting transcription for {len(batch)} files ....")
+        start_time = time.time()
+        try:
+            # 1. Transcribe audio, all files of the batch in one call
+            batch_segments = transcribe_batch(
+                model, [audio for _, audio in batch], batch_size
+            )
         except Exception as e:
-            logger.error(f"Error transcribing {audio_file}: {e}", exc_info=True)
+            logger.error(
+                f"Error transcribing batch, retrying files one at a time: {e}",
+                exc_info=True,
+            )
+            batch_segments = [
+                transcribe_file(model, audio_file, audio, batch_size)
+                for audio_file, audio in batch
+            ]
+
+        for (audio_file, audio), segments in zip(batch, batch_segments):
+            if should_stop(stop_event):
+                break
+            if segments is None:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(audio_file)
+                continue
+            try:
+                result = {"segments": segments, "language": "en"}
+                if diarize:
+                    # 2. Align whisper output
+                    result = whisperx.align(
+                        result["segments"],
+                        model_a,
+                        metadata,
+                        audio,
+                        torch_device,
+                        return_char_alignments=False,
+                    )
+                    # 3. Assign speaker labels
+                    diarize_segments = diarize_model(audio)
+                    result = whisperx.assign_word_speakers(diarize_segments, result)
+                    for segment in result["segments"]:
+                        del segment["words"]
+
+                # Save result to a JSON file
+                audio_file_name = os.path.basename(audio_file)
+                output_json_file = os.path.join(
+                    transcripts_dir,
+                    "unclassified_buffer",
+                    f"{audio_file_name[:-4]}.json",
+                )
+                pending_writes.append(
+                    (
+                        audio_file,
+                        transcript_writer.submit(
+                            write_transcript, output_json_file, result["segments"]
+                        ),
+                    )
+                )
+
+                # output_txt_file = os.path.join(transcripts_dir,
+                #                            f"{audio_file_name[:-4]}.txt")
+                # reformat_and_save(audio_file_name, output_txt_file, result, diarize)
+
+            except Exception as e:
+                logger.error(f"Error transcribing {audio_file}: {e}", exc_info=True)
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(audio_file)
+
+        end_time = time.time()
+        logger.info(
+            f"Transcription of {len(batch)} files completed in: {(end_time - start_time):.2f}s"
+        )
+        # The load balancer tracks files per second, so spread the batch time evenly
+        for _ in batch:
+            update_gpu_rate(device_index, (end_time - start_time) / len(batch))
+
+        del batch
+        gc.collect()
+        torch.cuda.empty_cache()
 
-        # Deleting the audio file from temp folder after transcription is complete
+    # Audio is only deleted once its transcript is saved, on a failed write it stays in
+    # the buffer to be transcribed again
+    for audio_file, write in pending_writes:
+        try:
+            write.result()
+        except Exception as e:
+            logger.error(f"Error saving transcript of {audio_file}: {e}", exc_info=True)
+            continue
         with contextlib.suppress(FileNotFoundError):
             os.remove(audio_file)
-
-    del model
-    if diarize:
-        del model_a
-        del diarize_model
-    gc.collect()
-    torch.cuda.empty_cache()
+        number_of_files_transcribed += 1
 
     return number_of_files_transcribed
 
@@ -184,4 +401,6 @@ if __name__ == "__main__":
     logger.info(f"whisper model parameters: {model_parameters}")
 
     audio_files = tuple(audio_files_list)
-    transcribe_audio(audio_files, model_parameters, models_dir, transcripts_dir)
+    models = load_models(model_parameters, models_dir)
+    transcribe_audio(audio_files, models, transcripts_dir)
+    release_models(models)
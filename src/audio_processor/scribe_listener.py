@@ -1,18 +1,19 @@
 """
 Create listener to check and trigger transcription for any audio files present/pending transcription in audio buffer folders.
 - Creates a separate listener for each GPU being used by the application.
-- When idle, listeners check for files in audio buffer folders in one minute intervals.
+- When idle, listeners sleep until the audio streamer signals a new file, re-checking audio buffer folders at least once a minute.
 - When audio files found in audio buffer, trigger transcription by call audio_processor.scribe:transcribe_audio function. 
 """
 
 import concurrent.futures
 import config
-import copy
+import multiprocessing
 import os
+import signal
 import time
 import threading
 
-from audio_processor.scribe import transcribe_audio
+from audio_processor.scribe import load_models, release_models, transcribe_audio
 from args import get_args
 from functools import partial
 from loguru import logger
@@ -20,12 +21,28 @@ from typing import List, Dict
 
 # from multiprocessing import Pool
 
+# Audio files the listener hands to transcription
+AUDIO_SUFFIXES = frozenset({".wav", ".mp3"})
+
+# Time a listener gets to finish its current file once its parent process is gone
+STOP_GRACE_SECONDS = 90
+
+# Set on SIGTERM so the listener stops at the next file boundary instead of mid-file
+stop_event = threading.Event()
+
+
+def request_stop(signum, frame) -> None:
+    stop_event.set()
+
 
 def start_thread_to_terminate_when_parent_process_dies(ppid):
     """
     Stop the backgroung listener when shutting down application.
+    SIGTERM asks the listener to stop after the file it is transcribing, the process
+    is ended outright if it is still around STOP_GRACE_SECONDS later.
     """
     pid = os.getpid()
+    signal.signal(signal.SIGTERM, request_stop)
 
     def f():
         while True:
@@ -33,12 +50,23 @@ def start_thread_to_terminate_when_parent_process_dies(ppid):
                 os.kill(ppid, 0)
             except OSError:
                 os.kill(pid, signal.SIGTERM)
+                time.sleep(STOP_GRACE_SECONDS)
+                os._exit(1)
             time.sleep(1)
 
     thread = threading.Thread(target=f, daemon=True)
     thread.start()
 
 
+def init_listener_process(ppid, shared_state) -> None:
+    """
+    Initializer for spawned listener processes: adopt the parent's shared config state,
+    then watch the parent so the listener stops when the application goes away.
+    """
+    config.set_shared_state(*shared_state)
+    start_thread_to_terminate_when_parent_process_dies(ppid)
+
+
 def start_multiple_scribe_listener(
     model_parameters: Dict[str, str],
     temp_file_dir: str,
@@ -64,8 +92,7 @@ def start_multiple_scribe_listener(
 
     for i in range(1, number_of_gpus + 1):
         # creating different model parameters for different GPUs, and assign unique device index for each
-        model_parameters_temp = copy.deepcopy(model_parameters)
-        model_parameters_temp["device_index"] = i - 1
+        model_parameters_temp = {**model_parameters, "device_index": i - 1}
         arguments = {
             "model_parameters": model_parameters_temp,
             "temp_file_dir": f"{temp_file_dir}_{i}",
@@ -81,10 +108,13 @@ def start_multiple_scribe_listener(
 
     logger.info("starting listener in background ...")
     try:
+        # Spawned rather than forked: forking a process that may already hold a CUDA
+        # context can hang the child, and each child initializes CUDA on its own GPU
         executor = concurrent.futures.ProcessPoolExecutor(
             len(argument_list),
-            initializer=start_thread_to_terminate_when_parent_process_dies,
-            initargs=(os.getpid(),),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_listener_process,
+            initargs=(os.getpid(), config.get_shared_state()),
         )
         executor.map(start_scribe_listener_with_args, argument_list)
         logger.info(f"starting listener in background successfull ...")
@@ -98,7 +128,7 @@ def start_multiple_scribe_listener(
 def start_scribe_listener(argument_list, models_dir, data_dir, transcripts_dir) -> None:
     """
     Keep checking argument_list['temp_file_dir'] for .mp3 files, if any found then trigger transcription for it and then delete it.
-    Stop the listener if the application is shutting down by checking config.shared_config['running'] periodically
+    Stop the listener if the application is shutting down by checking config.is_running() periodically
 
     Parameters:
         argument_list (dict): [
@@ -116,23 +146,35 @@ def start_scribe_listener(argument_list, models_dir, data_dir, transcripts_dir)
     model_parameters = argument_list["model_parameters"]
     temp_file_dir = argument_list["temp_file_dir"]
     logger.info("starting scribe listener .....")
+    # Models stay loaded on this listener's GPU for as long as the listener runs
+    models = load_models(model_parameters, models_dir)
+    # Set by the streamer only for files published into this listener's folder
+    audio_ready_event = config.audio_ready_events[model_parameters["device_index"]]
     try:
         # Keep running listener in the main thread
-        while config.shared_config["running"]:
+        while config.is_running() and not stop_event.is_set():
             logger.info(
-                f"checking for audio files pending transcription in {temp_file_dir} config.shared_config['running']: {config.shared_config['running']} ..."
+                f"checking for audio files pending transcription in {temp_file_dir} config.is_running(): {config.is_running()} ..."
             )
-            temp_files = os.listdir(temp_file_dir)
-            if temp_files:
-                audio_files = []
-                for file in temp_files:
-                    if file.endswith(".wav") or file.endswith(".mp3"):
-                        audio_files.append(os.path.join(temp_file_dir, file))
+            # Clear before listing so a file published after the listing still wakes us
+            audio_ready_event.clear()
+            # Segments still being recorded or transcoded carry a ".part" suffix
+            with os.scandir(temp_file_dir) as entries:
+                audio_entries = [
+                    entry
+                    for entry in entries
+                    if os.path.splitext(entry.name)[1] in AUDIO_SUFFIXES
+                    and entry.is_file()
+                ]
+            # Oldest recordings first so no station waits behind newer ones
+            audio_entries.sort(key=lambda entry: entry.stat().st_mtime)
+            audio_files = [entry.path for entry in audio_entries]
+            if audio_files:
                 logger.info(f"found {len(audio_files)} to be transcribed")
 
                 start_time = time.time()
                 number_of_files_transcribed = transcribe_audio(
-                    tuple(audio_files), model_parameters, models_dir, transcripts_dir
+                    tuple(audio_files), models, transcripts_dir, stop_event
                 )
                 end_time = time.time()
                 logger.info(
@@ -141,14 +183,16 @@ def start_scribe_listener(argument_list, models_dir, data_dir, transcripts_dir)
 
             else:
                 logger.info(
-                    f"no new audio files found in {temp_file_dir}, sleeping for 60 seconds ..."
+                    f"no new audio files found in {temp_file_dir}, waiting up to 60 seconds ..."
                 )
-                time.sleep(60)
+                audio_ready_event.wait(60)
         logger.info(
-            f"stopping scribe listener for buffer: {temp_file_dir} as config.shared_config['running']: {config.shared_config['running']}"
+            f"stopping scribe listener for buffer: {temp_file_dir} as config.is_running(): {config.is_running()}"
         )
     except (KeyboardInterrupt, SystemExit):
         logger.info(f"stopping scribe listener for buffer: {temp_file_dir} .....")
+    finally:
+        release_models(models)
 
     return
 
@@ -3,8 +3,53 @@ Global config shared across all the processes to keep track of if the applicatio
 Used in background listeners to keep checking if the application is running or shutting down.
 """
 
-from multiprocessing import Manager
+import ctypes
+import multiprocessing
 
-manager = Manager()
-shared_config = manager.dict()
-shared_config["running"] = False
+# Shared objects are created in the spawn context so they can be handed to spawned
+# listener processes; forked children inherit them just the same
+_context = multiprocessing.get_context("spawn")
+
+# Lives in shared memory, so checking it is a plain memory read in every process
+_running = _context.Value(ctypes.c_bool, False)
+
+
+def is_running() -> bool:
+    return _running.value
+
+
+def set_running(running: bool) -> None:
+    _running.value = running
+
+
+# Set when the application is shutting down so sleeping workers wake up immediately
+shutdown_event = _context.Event()
+
+# Most GPUs the buffer load balancer keeps throughput for
+MAX_GPUS = 16
+
+# One event per buffer folder (folder i belongs to GPU i - 1), set whenever an audio
+# file lands in that folder so only its idle scribe listener wakes up
+audio_ready_events = [_context.Event() for _ in range(MAX_GPUS)]
+
+# GPU device index -> moving average of files transcribed per second, 0 until measured
+gpu_rates = _context.Array(ctypes.c_double, MAX_GPUS)
+
+
+def get_shared_state() -> tuple:
+    """
+    The shared objects a spawned child process must receive to see this process's state.
+    """
+    return _running, shutdown_event, audio_ready_events, gpu_rates
+
+
+def set_shared_state(running, shutdown, audio_ready, rates) -> None:
+    """
+    Replace the objects a spawned child created when importing config with the ones
+    handed over from its parent by get_shared_state.
+    """
+    global _running, shutdown_event, audio_ready_events, gpu_rates
+    _running = running
+    shutdown_event = shutdown
+    audio_ready_events = audio_ready
+    gpu_rates = rates
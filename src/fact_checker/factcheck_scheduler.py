@@ -2,6 +2,8 @@ import os
 import sys
 import shutil
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.schedulers.base import BaseScheduler
+from apscheduler.schedulers.blocking import BlockingScheduler
 from apscheduler.triggers.cron import CronTrigger
 from typing import List
 from pytz import timezone
@@ -26,13 +28,16 @@ def create_factcheck_scheduler(
     tags: str,
     political_keywords: List[str],
     spiders: List[str],
-) -> BackgroundScheduler:
+    blocking: bool = False,
+) -> BaseScheduler:
 
-    scheduler = BackgroundScheduler()  # create a scheduler
-    scheduler.configure(timezone=timezone("US/Eastern"))
-    trigger = CronTrigger(
-        hour="6", minute="00"
-    )  # create a CronTrigger to run at 6 AM every day
+    # A blocking scheduler runs in the calling thread once started
+    scheduler_class = BlockingScheduler if blocking else BackgroundScheduler
+    scheduler = scheduler_class()  # create a scheduler
+    eastern = timezone("US/Eastern")
+    scheduler.configure(timezone=eastern)
+    # create a CronTrigger to run at 6 AM every day
+    trigger = CronTrigger(hour=6, minute=0, timezone=eastern)
     # trigger = CronTrigger(minute="*")  # create a CronTrigger to run every minute
 
     scheduler.add_job(
@@ -89,14 +94,11 @@ if __name__ == "__main__":
         tags,
         political_keywords,
         spiders,
+        blocking=True,
     )
     logger.info(f"Starting fact check scheduler ...")
-    factcheck_scheduler.start()
-    logger.info(f"Fact check scheduler running ...")
-
-    try:  # keep the script running
-        while True:
-            pass
+    try:  # blocks until interrupted instead of spinning the main thread
+        factcheck_scheduler.start()
     except (KeyboardInterrupt, SystemExit):  # shut down the scheduler on exit
         logger.info(f"Shutting down fact check scheduler ...")
         factcheck_scheduler.shutdown()
@@ -1,19 +1,55 @@
-import json
+import orjson
+import numpy as np
 from loguru import logger
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics import pairwise_distances
-from tqdm import tqdm
 from datetime import datetime
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
 
-# Convert date
+
+# Convert date, each distinct date string is only parsed once
+@lru_cache(maxsize=None)
 def parse_date(date_str):
     return datetime.strptime(date_str, "%m-%d-%Y")
 
 
-# Check if two dates are within the same week
-def is_within_same_week(date1, date2):
-    return abs((date1 - date2).days) < 7
+# Articles at least this similar (cosine similarity of TF-IDF vectors) are duplicates
+SIMILARITY_THRESHOLD = 0.4
+
+
+# Articles per block of the similarity product, each block is computed by one thread
+SIMILARITY_BLOCK_ROWS = 2048
+
+
+# Similarity of the block of articles from row start against all articles, keeping
+# only the pairs above the threshold with j > i so each pair appears once
+def similarity_block(tfidf, tfidf_t, start):
+    block = (tfidf[start : start + SIMILARITY_BLOCK_ROWS] @ tfidf_t).tocoo()
+    keep = (block.data > SIMILARITY_THRESHOLD) & (block.col > block.row + start)
+    return sparse.csr_matrix(
+        (block.data[keep], (block.row[keep], block.col[keep])), shape=block.shape
+    )
+
+
+# Fields of an article as written in a duplicate cluster
+def cluster_article(article):
+    return {
+        "title": article["title"],
+        "url": article["url"],
+        "author": article["author"],
+        "content": article["content"],
+        "date": article["date"],
+        "website": article["website"],
+        "ruling": article["ruling-unified"],
+    }
+
+
+# Check if two dates, given as day numbers, are within the same week
+def is_within_same_week(day1, day2):
+    return abs(day1 - day2) < 7
 
 
 def find_duplicates(factcheck_dir):
@@ -21,63 +57,94 @@ def find_duplicates(factcheck_dir):
     input_file_path = f"{factcheck_dir}/political_articles.json"
     output_file_path = f"{factcheck_dir}/deduplicated_articles.json"
 
-    with open(input_file_path, "r") as file:
-        articles = json.load(file)
+    with open(input_file_path, "rb") as file:
+        articles = orjson.loads(file.read())
+
+    # Split the articles and collect the fields used for matching in a single pass
+    articles_filtered, texts, dates, websites = [], [], [], []
+    unique_articles_no_content = []
+    for article in articles:
+        if article["content"]:
+            articles_filtered.append(article)
+            texts.append(article["content"])
+            dates.append(parse_date(article["date"]))
+            websites.append(article["website"])
+        else:
+            unique_articles_no_content.append(article)
+    del articles
+
+    # Day numbers, so the week check is plain integer arithmetic over all pairs
+    days = np.array(dates, dtype="datetime64[D]").astype(np.int64)
+    # Integer code per website, so pairs compare ints instead of strings
+    _, site_codes = np.unique(websites, return_inverse=True)
+    # Default TF-IDF weighting with L2-normalized rows, which the threshold is tuned on
+    try:
+        tfidf = TfidfVectorizer(dtype=np.float32).fit_transform(texts).tocsc()
+    except ValueError:
+        # No terms at all, so no article can be a duplicate of another
+        tfidf = sparse.csc_matrix((len(texts), 0), dtype=np.float32)
+    # Terms found in a single article never add to the similarity of a pair, so
+    # dropping them after normalization leaves every cosine unchanged while making
+    # the rows sparser and X @ X.T cheaper
+    tfidf = tfidf[:, np.diff(tfidf.indptr) > 1].tocsr()
+    # With L2-normalized rows the sparse product X @ X.T is the cosine similarity, and
+    # only pairs sharing a term produce an entry, so no dense N x N matrix is built.
+    # Output rows are independent, so blocks of rows are multiplied in parallel and
+    # thresholded before stacking to keep memory bounded.
+    # The transpose is converted to CSR once instead of in every block
+    tfidf_t = tfidf.T.tocsr()
+    starts = range(0, tfidf.shape[0], SIMILARITY_BLOCK_ROWS)
+    with ThreadPoolExecutor() as executor:
+        blocks = list(executor.map(partial(similarity_block, tfidf, tfidf_t), starts))
+    candidates = (
+        sparse.vstack(blocks).tocoo()
+        if blocks
+        else sparse.coo_matrix((0, 0), dtype=np.float32)
+    )
 
-    articles_filtered = [article for article in articles if article["content"]]
-    texts = [article["content"] for article in articles_filtered]
-    dates = [parse_date(article["date"]) for article in articles_filtered]
-    vectorizer = TfidfVectorizer().fit_transform(texts)
-    cosine_sim_matrix = 1 - pairwise_distances(vectorizer, metric="cosine")
+    # Duplicate edges: similar pairs from different websites within the same week
+    edges = (site_codes[candidates.row] != site_codes[candidates.col]) & (
+        is_within_same_week(days[candidates.row], days[candidates.col])
+    )
+    duplicate_graph = sparse.csr_matrix(
+        (
+            np.ones(np.count_nonzero(edges), dtype=np.int8),
+            (candidates.row[edges], candidates.col[edges]),
+        ),
+        shape=(len(articles_filtered), len(articles_filtered)),
+    )
+    # Articles linked by any chain of duplicate edges end up in the same cluster,
+    # regardless of the order the articles are in
+    _, labels = connected_components(duplicate_graph, directed=False)
+    cluster_sizes = np.bincount(labels)
 
     clusters = defaultdict(list)
-    duplicate_indices = set()
-    cluster_id = 0
+    duplicate_indices = np.zeros(len(articles_filtered), dtype=bool)
+    cluster_ids = {}
 
-    for i in tqdm(range(len(articles_filtered)), desc="Finding duplicates"):
-        if i in duplicate_indices:
+    # Clusters are numbered by their first article, which is also kept as unique
+    for index, label in enumerate(labels.tolist()):
+        if cluster_sizes[label] < 2:
             continue
-        current_cluster = [i]
-        for j in range(i + 1, len(articles_filtered)):
-            if (
-                cosine_sim_matrix[i][j] > 0.4
-                and articles_filtered[i]["website"] != articles_filtered[j]["website"]
-                and is_within_same_week(dates[i], dates[j])
-            ):
-                current_cluster.append(j)
-                duplicate_indices.add(j)
-        if len(current_cluster) > 1:
-            for index in current_cluster:
-                clusters[cluster_id].append(articles_filtered[index])
-            cluster_id += 1
-
-    duplicates = []
-    for cluster_id, cluster_articles in clusters.items():
-        duplicates.append(
-            {
-                "cluster_id": cluster_id,
-                "articles": [
-                    {
-                        "title": article["title"],
-                        "url": article["url"],
-                        "author": article["author"],
-                        "content": article["content"],
-                        "date": article["date"],
-                        "website": article["website"],
-                        "ruling": article["ruling-unified"],
-                    }
-                    for article in cluster_articles
-                ],
-            }
-        )
+        if label in cluster_ids:
+            duplicate_indices[index] = True
+        else:
+            cluster_ids[label] = len(cluster_ids)
+        clusters[cluster_ids[label]].append(index)
+
+    # Clusters hold article indices, the output fields are only built here
+    duplicates = [
+        {
+            "cluster_id": cluster_id,
+            "articles": [cluster_article(articles_filtered[i]) for i in members],
+        }
+        for cluster_id, members in clusters.items()
+    ]
 
     unique_articles_with_content = [
         article
         for idx, article in enumerate(articles_filtered)
-        if idx not in duplicate_indices
-    ]
-    unique_articles_no_content = [
-        article for article in articles if not article["content"]
+        if not duplicate_indices[idx]
     ]
     unique_articles = unique_articles_with_content + unique_articles_no_content
 
@@ -93,8 +160,8 @@ def find_duplicates(factcheck_dir):
         reverse=True,
     )
 
-    with open(output_file_path, "w") as file:
-        json.dump(sorted_articles, file, indent=4)
+    with open(output_file_path, "wb") as file:
+        file.write(orjson.dumps(sorted_articles, option=orjson.OPT_INDENT_2))
 
     logger.info(f"All {len(sorted_articles)} articles saved to {output_file_path}")
 
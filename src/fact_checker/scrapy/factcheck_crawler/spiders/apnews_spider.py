@@ -127,6 +127,12 @@ class APNewsSpider(scrapy.Spider):
             self.title_keys = title_keys.split(",")
         else:
             self.title_keys = []
+        # Match all title keywords with one case-insensitive regex scan per title
+        self.title_re = (
+            re.compile("|".join(map(re.escape, self.title_keys)), re.IGNORECASE)
+            if self.title_keys
+            else None
+        )
 
     def parse(self, response: Response) -> Generator[Request, None, None]:
         # Extract the links to the articles
@@ -136,13 +142,8 @@ class APNewsSpider(scrapy.Spider):
             url = article.css("h3.PagePromo-title a::attr(href)").get()  # url
 
             # Filter by title keyword
-            if self.title_keys:
-                if not any(
-                    keyword
-                    for keyword in self.title_keys
-                    if keyword.lower() in title.lower()
-                ):
-                    return
+            if self.title_re and not self.title_re.search(title):
+                continue
 
             # Follow url to article page
             if url:
@@ -162,11 +163,9 @@ class APNewsSpider(scrapy.Spider):
         # Get the date & time
         timestamp = response.css("bsp-timestamp::attr(data-timestamp)").get()
         if timestamp:
-            struct_time = time.localtime(int(timestamp) / 1000)
-            date = datetime.strptime(
-                time.strftime("%Y-%m-%d", struct_time), "%Y-%m-%d"
-            ).date()  # date
-            time_of_day = time.strftime("%H:%M:%S", struct_time)  # time
+            published = datetime.fromtimestamp(int(timestamp) / 1000)
+            date = published.date()  # date
+            time_of_day = published.strftime("%H:%M:%S")  # time
 
             author = response.css(
                 "div.Page-authors a.Link::text, div.Page-authors span::text"
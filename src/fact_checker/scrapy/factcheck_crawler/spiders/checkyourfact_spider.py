@@ -1,11 +1,15 @@
 import scrapy
 import time
+import re
 from datetime import datetime
 from dateutil import parser
 from typing import Generator, Dict, Any
 from scrapy.http import Response
 from scrapy import Request
 
+# Translation table that deletes tabs and line breaks from content in one pass
+STRIP_CONTROL_CHARS = str.maketrans("", "", "\t\n\r")
+
 
 class CheckYourFactSpider(scrapy.Spider):
     """
@@ -129,6 +133,12 @@ class CheckYourFactSpider(scrapy.Spider):
             self.title_keys = title_keys.split(",")
         else:
             self.title_keys = []
+        # Match all title keywords with one case-insensitive regex scan per title
+        self.title_re = (
+            re.compile("|".join(map(re.escape, self.title_keys)), re.IGNORECASE)
+            if self.title_keys
+            else None
+        )
 
     def parse(self, response: Response) -> Generator[Request, None, None]:
         # Extract the links to the articles
@@ -145,13 +155,8 @@ class CheckYourFactSpider(scrapy.Spider):
             url = article.xpath("parent::a/@href").get()  # url
 
             # Filter by title keyword
-            if self.title_keys:
-                if not any(
-                    keyword
-                    for keyword in self.title_keys
-                    if keyword.lower() in title.lower()
-                ):
-                    continue
+            if self.title_re and not self.title_re.search(title):
+                continue
 
             # Follow url to article page
             if url:
@@ -198,7 +203,7 @@ class CheckYourFactSpider(scrapy.Spider):
         if start_idx != -1:
             content = content[start_idx:]
 
-        content = content.replace("\t", "").replace("\n", "").replace("\r", "").strip()
+        content = content.translate(STRIP_CONTROL_CHARS).strip()
 
         # Filter by date range
         if date < self.start_date or date > self.end_date:
@@ -1,5 +1,6 @@
 import scrapy
 import time
+import re
 from datetime import datetime
 from typing import Generator, Dict, Any
 from scrapy.http import Response
@@ -126,6 +127,12 @@ class FactCheckSpider(scrapy.Spider):
             self.title_keys = title_keys.split(",")
         else:
             self.title_keys = []
+        # Match all title keywords with one case-insensitive regex scan per title
+        self.title_re = (
+            re.compile("|".join(map(re.escape, self.title_keys)), re.IGNORECASE)
+            if self.title_keys
+            else None
+        )
 
     def parse(self, response: Response) -> Generator[Request, None, None]:
         # Extract the links to the articles
@@ -152,13 +159,8 @@ class FactCheckSpider(scrapy.Spider):
         date = datetime.fromisoformat(date).date()  # format date
 
         # Filter articles by title keywords
-        if self.title_keys:
-            if not any(
-                keyword
-                for keyword in self.title_keys
-                if keyword.lower() in title.lower()
-            ):
-                return
+        if self.title_re and not self.title_re.search(title):
+            return
 
         # Filter by date range
         if date < self.start_date or date > self.end_date:
@@ -1,5 +1,6 @@
 import scrapy
 import time
+import re
 from datetime import datetime
 from dateutil import parser
 from typing import Generator, Dict, Any
@@ -130,6 +131,12 @@ class LeadStoriesSpider(scrapy.Spider):
             self.title_keys = title_keys.split(",")
         else:
             self.title_keys = []
+        # Match all title keywords with one case-insensitive regex scan per title
+        self.title_re = (
+            re.compile("|".join(map(re.escape, self.title_keys)), re.IGNORECASE)
+            if self.title_keys
+            else None
+        )
 
     def parse(self, response: Response) -> Generator[Dict[str, Any], None, None]:
         # Extract the links to the articles
@@ -165,13 +172,8 @@ class LeadStoriesSpider(scrapy.Spider):
                 continue
 
             # Filter articles by title keywords
-            if self.title_keys:
-                if not any(
-                    keyword
-                    for keyword in self.title_keys
-                    if keyword.lower() in title.lower()
-                ):
-                    continue
+            if self.title_re and not self.title_re.search(title):
+                continue
 
             # Follow url to article page
             if url:
@@ -1,5 +1,6 @@
 import scrapy
 import time
+import re
 from datetime import datetime
 from typing import Generator, Dict, Any
 from scrapy.http import Response
@@ -130,6 +131,12 @@ class PolitifactSpider(scrapy.Spider):
             self.title_keys = title_keys.split(",")
         else:
             self.title_keys = []
+        # Match all title keywords with one case-insensitive regex scan per title
+        self.title_re = (
+            re.compile("|".join(map(re.escape, self.title_keys)), re.IGNORECASE)
+            if self.title_keys
+            else None
+        )
 
         # Set the tags for filtering
         if tags:
@@ -163,13 +170,8 @@ class PolitifactSpider(scrapy.Spider):
             ).get()  # ruling
 
             # Filter articles by title keywords
-            if self.title_keys:
-                if not any(
-                    keyword
-                    for keyword in self.title_keys
-                    if keyword.lower() in title.lower()
-                ):
-                    continue
+            if self.title_re and not self.title_re.search(title):
+                continue
 
             # Filter by date range
             if date_obj < self.start_date or date_obj > self.end_date:
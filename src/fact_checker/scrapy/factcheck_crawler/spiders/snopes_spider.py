@@ -6,6 +6,9 @@ from typing import Generator, Dict, Any
 from scrapy.http import Response
 from scrapy import Request
 
+# Translation table that deletes tabs and line breaks from content in one pass
+STRIP_CONTROL_CHARS = str.maketrans("", "", "\t\n")
+
 
 class SnopesSpider(scrapy.Spider):
     """
@@ -129,6 +132,12 @@ class SnopesSpider(scrapy.Spider):
             self.title_keys = title_keys.split(",")
         else:
             self.title_keys = []
+        # Match all title keywords with one case-insensitive regex scan per title
+        self.title_re = (
+            re.compile("|".join(map(re.escape, self.title_keys)), re.IGNORECASE)
+            if self.title_keys
+            else None
+        )
 
         # Set the tags for filtering
         if tags:
@@ -168,13 +177,8 @@ class SnopesSpider(scrapy.Spider):
                 continue
 
             # Filter articles by title keywords
-            if self.title_keys:
-                if not any(
-                    keyword
-                    for keyword in self.title_keys
-                    if keyword.lower() in title.lower()
-                ):
-                    continue
+            if self.title_re and not self.title_re.search(title):
+                continue
 
             # Follow url to article page
             if url:
@@ -214,7 +218,7 @@ class SnopesSpider(scrapy.Spider):
             if not any(tag.lower() in [t.lower() for t in tags] for tag in self.tags):
                 return
 
-        content = content.replace("\t", "").replace("\n", "")  # format content
+        content = content.translate(STRIP_CONTROL_CHARS)  # format content
 
         ruling = response.css("div.rating_title_wrap::text").get()  # ruling
 
@@ -1,5 +1,6 @@
 import scrapy
 import time
+import re
 from datetime import datetime
 from typing import Generator, Dict, Any
 from scrapy.http import Response
@@ -130,6 +131,12 @@ class TruthOrFictionSpider(scrapy.Spider):
             self.title_keys = title_keys.split(",")
         else:
             self.title_keys = []
+        # Match all title keywords with one case-insensitive regex scan per title
+        self.title_re = (
+            re.compile("|".join(map(re.escape, self.title_keys)), re.IGNORECASE)
+            if self.title_keys
+            else None
+        )
 
         # Set the tags for filtering
         if tags:
@@ -145,13 +152,8 @@ class TruthOrFictionSpider(scrapy.Spider):
             url = article.css("h2.entry-title a::attr(href)").get()  # url
 
             # Filter articles by title keywords
-            if self.title_keys:
-                if not any(
-                    keyword
-                    for keyword in self.title_keys
-                    if keyword.lower() in title.lower()
-                ):
-                    continue
+            if self.title_re and not self.title_re.search(title):
+                continue
 
             date = article.css("span.published::text").get()  # date
             date = datetime.strptime(date.strip(), "%B %d, %Y").date()  # format date
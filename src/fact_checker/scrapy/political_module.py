@@ -1,8 +1,26 @@
 import json
 import os
+import re
+from functools import lru_cache
 from loguru import logger
 
 
+@lru_cache(maxsize=8)
+def compile_keyword_pattern(political_keywords: tuple):
+    """
+    Compile the keywords into one alternation so each text is scanned once
+    instead of once per keyword. Returns None when there are no keywords.
+    """
+    if not political_keywords:
+        return None
+    return re.compile(
+        "|".join(
+            re.escape(keyword)
+            for keyword in sorted(political_keywords, key=len, reverse=True)
+        )
+    )
+
+
 def is_political(article: dict, political_keywords: list) -> bool:
     """
     Determines if an article is political based on the presence of specific keywords.
@@ -25,17 +43,20 @@ def is_political(article: dict, political_keywords: list) -> bool:
         True
     """
 
+    keyword_pattern = compile_keyword_pattern(tuple(political_keywords))
+    if keyword_pattern is None:
+        return False
+
     title = article.get("title", "").lower()
     content = article.get("content", "").lower() if article.get("content") else ""
     tags = article.get("tags", [])
 
-    for keyword in political_keywords:
-        if keyword in title or keyword in content:
-            return True
-        if tags:
-            for tag in tags:
-                if tag and keyword in tag.lower():
-                    return True
+    if keyword_pattern.search(title) or keyword_pattern.search(content):
+        return True
+    if tags:
+        for tag in tags:
+            if tag and keyword_pattern.search(tag.lower()):
+                return True
 
     return False
 
@@ -138,7 +138,7 @@ def classification_listener(transcripts_dir: str) -> None:
     classified_apolitical_file_dir = os.path.join(classified_file_dir, "apolitical")
 
     try:
-        while config.shared_config["running"]:
+        while config.is_running():
             # files to be classified in one batch, default is 10 (based on gemini api rate limit)
             n = args.concurrent_classification
             logger.info(
@@ -221,7 +221,7 @@ def classification_listener(transcripts_dir: str) -> None:
                     os.remove(temp_file)
             logger.info(f"classified for {n} files successfully!")
         logger.info(
-            f"stopping classification listener for buffer: {temp_file_dir} as config.shared_config['running']: {config.shared_config['running']}"
+            f"stopping classification listener for buffer: {temp_file_dir} as config.is_running(): {config.is_running()}"
         )
     except (KeyboardInterrupt, SystemExit):
         logger.info(f"stopped classification listener")
@@ -32,7 +32,11 @@ def stop_background_processes(
         radio_scheduler, factcheck_scheduler, executor, classification_executor
 ):
     logger.info("application shuting down ...")
-    config.shared_config["running"] = False
+    config.set_running(False)
+    config.shutdown_event.set()
+    # Wake idle scribe listeners so they notice the shutdown
+    for audio_ready_event in config.audio_ready_events:
+        audio_ready_event.set()
     if radio_scheduler:
         radio_scheduler.remove_all_jobs()
         radio_scheduler.shutdown(wait=False)
@@ -92,6 +96,8 @@ def start_observatory():
         tmp = f"{audio_buffer_dir}_{i + 1}"
         n = len(os.listdir(f"{audio_buffer_dir}_{i + 1}"))
         logger.info(f"number of files in {tmp} :{n}")
+    # Segments being recorded, moved into a buffer folder once complete
+    os.makedirs(f"{audio_buffer_dir}_staging", exist_ok=True)
 
     os.makedirs(transcripts_temp_dir, exist_ok=True)
     os.makedirs(classified_file_dir, exist_ok=True)
@@ -133,9 +139,10 @@ def start_observatory():
     try:
         for i in range(repetitions):
             flag = 1
-            config.shared_config["running"] = True
+            config.set_running(True)
+            config.shutdown_event.clear()
             logger.info(
-                f"config.shared_config['running'] : {config.shared_config['running']}"
+                f"config.is_running() : {config.is_running()}"
             )
             # start radio scheduler for streaming audio and saving it in audio dir
             if not args.stop_recording:
@@ -149,6 +156,7 @@ def start_observatory():
                     radio_schedule_file,
                     segment_duration,
                     number_of_gpus,
+                    args.transcode_audio,
                 )
                 radio_scheduler.start()
                 logger.info(f"radio scheduler running .....")
@@ -0,0 +1,120 @@
+"""
+Check that sentiment metrics read merged files in both the parallel-list format and the
+older list-of-dicts format.
+To run the test execute from root directory:
+  >>> python -m unittest test.calculate_metrics_test
+
+"""
+
+import csv
+import orjson
+import os
+import sys
+import tempfile
+import unittest
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_DIR, "..", "src", "analytics", "sentiment"))
+
+from calculate_metrics import calc_metrics, merge
+
+OLD_FORMAT = {
+    "NY": {
+        "WABC": {
+            "Trump": [
+                {"label": "positive", "score": 0.9, "text": "a"},
+                {"label": "negative", "score": 0.8, "text": "b"},
+                {"label": "neutral", "score": 0.7, "text": "c"},
+                {"label": "negative", "score": 0.6, "text": "d"},
+            ],
+            "Biden": [],
+        }
+    }
+}
+
+NEW_FORMAT = {
+    "NY": {
+        "WABC": {
+            "Trump": {
+                "label": ["positive", "negative", "neutral", "negative"],
+                "score": [0.9, 0.8, 0.7, 0.6],
+                "text": ["a", "b", "c", "d"],
+            },
+            "Biden": {"label": [], "score": [], "text": []},
+        }
+    }
+}
+
+EXPECTED_ROWS = [
+    [
+        "State",
+        "Call_Sign",
+        "Trump_Positive_Count",
+        "Trump_Neutral_Count",
+        "Trump_Negative_Count",
+        "Biden_Positive_Count",
+        "Biden_Neutral_Count",
+        "Biden_Negative_Count",
+    ],
+    ["NY", "WABC", "1", "1", "2", "0", "0", "0"],
+]
+
+
+def read_csv(file_path):
+    with open(file_path, newline="") as f:
+        return list(csv.reader(f))
+
+
+class TestCalcMetrics(unittest.TestCase):
+    def test_old_format_file(self):
+        with tempfile.TemporaryDirectory() as dest_dir:
+            merged_file = os.path.join(dest_dir, "2024_07_01.json")
+            with open(merged_file, "wb") as f:
+                f.write(orjson.dumps(OLD_FORMAT))
+            with open(merged_file, "rb") as f:
+                text = orjson.loads(f.read())
+
+            calc_metrics(text, dest_dir, "2024_07_01", ["Trump", "Biden"])
+
+            rows = read_csv(os.path.join(dest_dir, "2024_07_01.csv"))
+        self.assertEqual(rows, EXPECTED_ROWS)
+
+    def test_new_format(self):
+        with tempfile.TemporaryDirectory() as dest_dir:
+            calc_metrics(NEW_FORMAT, dest_dir, "2024_07_01", ["Trump", "Biden"])
+
+            rows = read_csv(os.path.join(dest_dir, "2024_07_01.csv"))
+        self.assertEqual(rows, EXPECTED_ROWS)
+
+
+class TestMerge(unittest.TestCase):
+    def test_old_and_new_files_merge_into_parallel_lists(self):
+        old_keywords = OLD_FORMAT["NY"]["WABC"]
+        new_keywords = NEW_FORMAT["NY"]["WABC"]
+        files = {
+            "old.json": {"NY": {"WABC": {"2024_07_01_00_00": old_keywords}}},
+            "new.json": {"NY": {"WABC": {"2024_07_01_00_30": new_keywords}}},
+        }
+        expected = NEW_FORMAT["NY"]["WABC"]["Trump"]
+
+        with tempfile.TemporaryDirectory() as source_dir:
+            for name, content in files.items():
+                with open(os.path.join(source_dir, name), "wb") as f:
+                    f.write(orjson.dumps(content))
+            with tempfile.TemporaryDirectory() as dest_dir:
+                result = merge(source_dir, dest_dir, "2024_07_01")
+
+        trump = result["NY"]["WABC"]["Trump"]
+        self.assertEqual(sorted(trump["text"]), sorted(2 * expected["text"]))
+        self.assertEqual(len(trump["label"]), len(trump["text"]))
+        self.assertEqual(len(trump["score"]), len(trump["text"]))
+        # Fields of one segment stay at the same position in every list
+        for label, score, text in zip(trump["label"], trump["score"], trump["text"]):
+            index = expected["text"].index(text)
+            self.assertEqual(label, expected["label"][index])
+            self.assertEqual(score, expected["score"][index])
+        self.assertEqual(result["NY"]["WABC"]["Biden"]["label"], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+"""
+Check that fact-check articles are clustered as duplicates when they are similar, from
+different websites and published within a week of each other.
+To run the test execute from root directory:
+  >>> python -m unittest test.duplicates_module_test
+
+"""
+
+import orjson
+import os
+import sys
+import tempfile
+import unittest
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_DIR, "..", "src", "fact_checker", "scrapy"))
+
+from duplicates_module import find_duplicates
+
+ELECTION = "Ballots mailed twice in county election audit claim viral post"
+VACCINE = "Vaccine trial results misrepresented hospital data shared online"
+
+
+def article(title, website, date, content):
+    return {
+        "title": title,
+        "url": f"https://{website}.example/{title}",
+        "author": None,
+        "content": content,
+        "date": date,
+        "website": website,
+        "ruling-unified": "false",
+    }
+
+
+def run_find_duplicates(articles):
+    with tempfile.TemporaryDirectory() as factcheck_dir:
+        with open(os.path.join(factcheck_dir, "political_articles.json"), "wb") as f:
+            f.write(orjson.dumps(articles))
+        find_duplicates(factcheck_dir)
+        with open(os.path.join(factcheck_dir, "deduplicated_articles.json"), "rb") as f:
+            return orjson.loads(f.read())
+
+
+def split_output(output):
+    clusters = [entry for entry in output if "cluster_id" in entry]
+    unique = [entry for entry in output if "cluster_id" not in entry]
+    return clusters, unique
+
+
+class TestFindDuplicates(unittest.TestCase):
+    def test_clusters_and_unique_articles(self):
+        articles = [
+            article("a1", "snopes", "07-01-2024", ELECTION),
+            article("a2", "politifact", "07-02-2024", ELECTION),
+            article("a3", "apnews", "07-03-2024", ELECTION),
+            article("b1", "snopes", "07-01-2024", VACCINE),
+            # Same story, but more than a week later
+            article("b2", "politifact", "08-01-2024", VACCINE),
+            article("c1", "snopes", "07-04-2024", ""),
+        ]
+
+        clusters, unique = split_output(run_find_duplicates(articles))
+
+        self.assertEqual(len(clusters), 1)
+        self.assertEqual(clusters[0]["cluster_id"], 0)
+        self.assertEqual(
+            [member["title"] for member in clusters[0]["articles"]], ["a1", "a2", "a3"]
+        )
+        self.assertEqual(
+            set(clusters[0]["articles"][0]),
+            {"title", "url", "author", "content", "date", "website", "ruling"},
+        )
+        # The first article of a cluster is also kept as unique
+        self.assertEqual(
+            sorted(entry["title"] for entry in unique), ["a1", "b1", "b2", "c1"]
+        )
+
+    def test_clusters_are_transitive(self):
+        # x1 and x3 share a website, but both are duplicates of x2
+        articles = [
+            article("x1", "snopes", "07-01-2024", ELECTION),
+            article("x2", "politifact", "07-02-2024", ELECTION),
+            article("x3", "snopes", "07-03-2024", ELECTION),
+            article("y1", "apnews", "07-01-2024", VACCINE),
+            article("y2", "apnews", "07-02-2024", VACCINE),
+        ]
+
+        clusters, unique = split_output(run_find_duplicates(articles))
+
+        self.assertEqual(len(clusters), 1)
+        self.assertEqual(
+            [member["title"] for member in clusters[0]["articles"]], ["x1", "x2", "x3"]
+        )
+        self.assertEqual(sorted(entry["title"] for entry in unique), ["x1", "y1", "y2"])
+
+    def test_single_article(self):
+        articles = [article("a1", "snopes", "07-01-2024", ELECTION)]
+
+        clusters, unique = split_output(run_find_duplicates(articles))
+
+        self.assertEqual(clusters, [])
+        self.assertEqual([entry["title"] for entry in unique], ["a1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
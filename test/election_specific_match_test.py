@@ -0,0 +1,104 @@
+"""
+Check that election claim analysis keeps one result per document, in document order.
+To run the test execute from root directory:
+  >>> python -m unittest test.election_specific_match_test
+
+"""
+
+import os
+import sys
+import unittest
+
+import torch
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPT_DIR = os.path.join(TEST_DIR, "..", "src", "analytics", "track_narratives")
+sys.path.insert(0, SCRIPT_DIR)
+
+from election_specific_match import analyze_batch, parse_model_output
+
+
+class FakeEncoding(dict):
+    def to(self, device):
+        return self
+
+
+class FakeTokenizer:
+    def __init__(self, responses, prompt_tokens=4):
+        self.responses = responses
+        self.prompt_tokens = prompt_tokens
+        self.decoded_lengths = []
+
+    def __call__(self, prompts, **kwargs):
+        return FakeEncoding(
+            input_ids=torch.zeros((len(prompts), self.prompt_tokens), dtype=torch.long)
+        )
+
+    def batch_decode(self, outputs, skip_special_tokens=True):
+        self.decoded_lengths.append(outputs.shape[1])
+        return self.responses[: len(outputs)]
+
+
+class FakeModel:
+    def generate(self, input_ids, max_new_tokens):
+        generated = torch.ones((input_ids.shape[0], 2), dtype=torch.long)
+        return torch.cat([input_ids, generated], dim=1)
+
+
+class TestAnalyzeBatch(unittest.TestCase):
+    def test_results_line_up_with_documents(self):
+        responses = [
+            "Nothing relevant here.",
+            '{"mention_count": 2, "stance": "support"}',
+            "No answer either.",
+            '"mention_count": 1, "stance": "debunk"',
+        ]
+        documents = ["first", "second", "third", "fourth"]
+
+        results = analyze_batch(documents, FakeTokenizer(responses), FakeModel(), "cpu")
+
+        self.assertEqual(len(results), len(documents))
+        self.assertEqual(
+            results,
+            [
+                None,
+                {"mention_count": 2, "stance": "support"},
+                None,
+                {"mention_count": 1, "stance": "debunk"},
+            ],
+        )
+
+    def test_only_generated_tokens_are_decoded(self):
+        tokenizer = FakeTokenizer(["No answer."], prompt_tokens=4)
+
+        analyze_batch(["document"], tokenizer, FakeModel(), "cpu")
+
+        # FakeModel generates 2 tokens after the 4 prompt tokens
+        self.assertEqual(tokenizer.decoded_lengths, [2])
+
+
+class TestParseModelOutput(unittest.TestCase):
+    def test_json_answer(self):
+        self.assertEqual(
+            parse_model_output('Answer: {"mention_count": 3, "stance": "vanilla"}'),
+            {"mention_count": 3, "stance": "vanilla"},
+        )
+
+    def test_fields_without_json(self):
+        self.assertEqual(
+            parse_model_output('"mention_count": 2,\n"stance": "Debunk"'),
+            {"mention_count": 2, "stance": "debunk"},
+        )
+
+    def test_prefilter_ignores_case(self):
+        self.assertEqual(parse_model_output('{"Stolen": true}'), {"Stolen": True})
+
+    def test_unrelated_response(self):
+        self.assertIsNone(parse_model_output("I cannot answer that."))
+
+    def test_zero_mentions(self):
+        self.assertIsNone(parse_model_output('"mention_count": 0'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+"""
+Check that files transcribed together in one batch get their own segments back, with
+timestamps relative to the start of each file.
+To run the test execute from root directory:
+  >>> python -m unittest test.scribe_batch_test
+
+"""
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC_DIR)
+
+from audio_processor.scribe import (
+    BATCH_GAP_SECONDS,
+    SAMPLE_RATE,
+    transcribe_batch,
+    transcribe_file,
+)
+
+
+class FakeModel:
+    def __init__(self, segments=None, error=None):
+        self.segments = segments or []
+        self.error = error
+        self.audio_lengths = []
+
+    def transcribe(self, audio, batch_size, language):
+        self.audio_lengths.append(len(audio))
+        if self.error:
+            raise self.error
+        return {"segments": self.segments, "language": language}
+
+
+def silence(seconds):
+    return np.zeros(seconds * SAMPLE_RATE, dtype=np.float32)
+
+
+class TestTranscribeBatch(unittest.TestCase):
+    def test_segments_are_split_back_per_file(self):
+        # Each file is followed by BATCH_GAP_SECONDS of silence in the joined audio
+        audios = [silence(10), silence(10), silence(20)]
+        third_start = 2 * (10 + BATCH_GAP_SECONDS)
+        model = FakeModel(
+            segments=[
+                {"start": 1.0, "end": 5.0, "text": "first"},
+                {"start": third_start + 1.5, "end": third_start + 5.0, "text": "third"},
+                {
+                    "start": third_start + 10.0,
+                    "end": third_start + 18.25,
+                    "text": "third again",
+                },
+            ]
+        )
+
+        batch_segments = transcribe_batch(model, audios, batch_size=8)
+
+        self.assertEqual(
+            model.audio_lengths, [(40 + 3 * BATCH_GAP_SECONDS) * SAMPLE_RATE]
+        )
+        self.assertEqual(
+            batch_segments,
+            [
+                [{"start": 1.0, "end": 5.0, "text": "first"}],
+                [],
+                [
+                    {"start": 1.5, "end": 5.0, "text": "third"},
+                    {"start": 10.0, "end": 18.25, "text": "third again"},
+                ],
+            ],
+        )
+
+    def test_single_file_keeps_its_timestamps(self):
+        segments = [{"start": 2.5, "end": 7.0, "text": "only"}]
+        model = FakeModel(segments=segments)
+
+        self.assertEqual(transcribe_batch(model, [silence(10)], 8), [segments])
+
+    def test_transcribe_file_returns_none_on_error(self):
+        model = FakeModel(error=RuntimeError("CUDA out of memory"))
+
+        self.assertIsNone(transcribe_file(model, "bad.mp3", silence(5), 8))
+
+    def test_transcribe_file_returns_segments(self):
+        segments = [{"start": 0.0, "end": 3.0, "text": "hello"}]
+        model = FakeModel(segments=segments)
+
+        self.assertEqual(transcribe_file(model, "good.mp3", silence(5), 8), segments)
+
+
+if __name__ == "__main__":
+    unittest.main()
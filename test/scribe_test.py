@@ -9,7 +9,7 @@ import unittest
 
 from datetime import date
 from src.audio_processor.args import get_args
-from src.audio_processor.scribe import transcribe_audio
+from src.audio_processor.scribe import load_models, transcribe_audio
 
 
 class TestAudioStreamer(unittest.TestCase):
@@ -49,7 +49,8 @@ class TestAudioStreamer(unittest.TestCase):
                 os.remove(file)
 
         # Run the parallel streaming function
-        transcribe_audio(audio_files, model_parameters,  models_dir)
+        models = load_models(model_parameters, models_dir)
+        transcribe_audio(audio_files, models)
 
         # Verify that the files were created
         for file in expected_files: